@@ -0,0 +1,6 @@
+"""
+Benchmarks of nodemetrics on seeded synthetic graphs.
+
+Run the suite with:
+    python3 -m benchmarks [--sizes 100 200 400] [--output results.json] [--baseline baseline.json]
+"""
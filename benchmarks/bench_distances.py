@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Compares the batched distance API of nodemetrics.Graph with looping over
+Graph.min_dist for every pair of vertices.
+
+Usage:
+    python3 benchmarks/bench_distances.py [num_of_nodes ...]
+"""
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from nodemetrics import Graph
+
+
+def random_graph(num_of_nodes, avg_degree=4, seed=0):
+    """
+    Builds a random graph with a spanning path, so that it is connected
+    """
+    rng=random.Random(seed)
+    edges={(i, i+1) for i in range(num_of_nodes-1)}
+    while len(edges)<num_of_nodes*avg_degree//2:
+        u, v=rng.sample(range(num_of_nodes), 2)
+        edges.add((min(u, v), max(u, v)))
+    return(Graph(list(range(num_of_nodes)), sorted(edges), cache_bytes=None))
+
+
+def time_min_dist_loop(num_of_nodes):
+    graph=random_graph(num_of_nodes)
+    start=time.perf_counter()
+    for u in graph.vertices:
+        for v in graph.vertices:
+            graph.min_dist(u, v)
+    return(time.perf_counter()-start)
+
+
+def time_distance_matrix(num_of_nodes):
+    graph=random_graph(num_of_nodes)
+    start=time.perf_counter()
+    graph.distance_matrix()
+    return(time.perf_counter()-start)
+
+
+if __name__ == "__main__":
+    sizes=[int(arg) for arg in sys.argv[1:]] or [100, 200, 400, 800]
+    print("{:>8} {:>14} {:>18} {:>9}".format("nodes", "min_dist loop", "distance_matrix", "speedup"))
+    for num_of_nodes in sizes:
+        loop=time_min_dist_loop(num_of_nodes)
+        matrix=time_distance_matrix(num_of_nodes)
+        print("{:>8} {:>13.3f}s {:>17.3f}s {:>8.1f}x".format(num_of_nodes, loop, matrix, loop/matrix))
@@ -0,0 +1,75 @@
+"""
+Seeded generators of synthetic graphs for benchmarks.
+
+Every generator returns a pair (vertices, edges) of lists in the format taken
+by nodemetrics.Graph, with vertices 0..n-1 and each edge as an ordered 2-tuple.
+"""
+
+import random
+
+
+def erdos_renyi(num_of_nodes, avg_degree=4, seed=0):
+    """
+    G(n, m) random graph with num_of_nodes*avg_degree/2 edges chosen
+    uniformly at random
+    """
+    rng=random.Random(seed)
+    num_of_edges=min(num_of_nodes*avg_degree//2, num_of_nodes*(num_of_nodes-1)//2)
+    edges=set()
+    while len(edges)<num_of_edges:
+        u, v=rng.randrange(num_of_nodes), rng.randrange(num_of_nodes)
+        if u!=v:
+            edges.add((min(u, v), max(u, v)))
+    return(list(range(num_of_nodes)), sorted(edges))
+
+
+def barabasi_albert(num_of_nodes, m=2, seed=0):
+    """
+    Barabasi-Albert preferential attachment graph, where every new vertex
+    attaches to m distinct existing vertices chosen with probability
+    proportional to their degree
+    """
+    rng=random.Random(seed)
+    edges=[]
+    #Every vertex appears in this list once per incident edge
+    ends=[]
+    for v in range(1, min(m+1, num_of_nodes)):
+        for u in range(v):
+            edges.append((u, v))
+            ends+=[u, v]
+    for v in range(m+1, num_of_nodes):
+        chosen=set()
+        while len(chosen)<m:
+            chosen.add(rng.choice(ends))
+        for u in sorted(chosen):
+            edges.append((u, v))
+            ends+=[u, v]
+    return(list(range(num_of_nodes)), edges)
+
+
+def grid(num_of_nodes, seed=0):
+    """
+    Square grid graph with about num_of_nodes vertices. seed is unused and
+    only accepted for a uniform generator signature.
+    """
+    side=max(1, int(round(num_of_nodes**0.5)))
+    vertices=list(range(side*side))
+    edges=[(v, v+1) for v in vertices if v%side!=side-1]
+    edges+=[(v, v+side) for v in vertices if v+side<side*side]
+    return(vertices, sorted(edges))
+
+
+def path(num_of_nodes, seed=0):
+    """
+    Path graph 0-1-...-(num_of_nodes-1). seed is unused and only accepted for
+    a uniform generator signature.
+    """
+    return(list(range(num_of_nodes)), [(v, v+1) for v in range(num_of_nodes-1)])
+
+
+GENERATORS={
+    "erdos_renyi": erdos_renyi,
+    "barabasi_albert": barabasi_albert,
+    "grid": grid,
+    "path": path,
+}
@@ -0,0 +1,250 @@
+"""
+Times nodemetrics operations on synthetic graphs of increasing size, reports
+wall time, peak memory and fitted scaling exponents, and compares them with a
+stored baseline.
+"""
+
+import argparse
+import gc
+import json
+import math
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from nodemetrics import Graph
+from benchmarks.generators import GENERATORS
+
+#Number of (start, end) queries timed by the min_dist and all_shortest_paths benchmarks
+NUM_OF_QUERIES=16
+
+#Pairs with more shortest paths than this are not used to time all_shortest_paths,
+#as listing them would measure the size of the output only
+MAX_PATHS_PER_QUERY=10000
+
+#Timings below this many seconds are too noisy to flag as regressions or to fit
+#scaling exponents on
+MIN_SECONDS=0.01
+
+
+def random_pairs(vertices, rng):
+    return([tuple(rng.sample(vertices, 2)) for _ in range(NUM_OF_QUERIES)])
+
+
+def setup_init(vertices, edges, rng):
+    return(lambda: Graph(vertices, edges))
+
+
+def setup_validate(vertices, edges, rng):
+    return(Graph(vertices, edges).validate)
+
+
+def setup_min_dist(vertices, edges, rng):
+    graph=Graph(vertices, edges)
+    pairs=random_pairs(vertices, rng)
+    return(lambda: [graph.min_dist(u, v) for u, v in pairs])
+
+
+def setup_all_shortest_paths(vertices, edges, rng):
+    #Pairs are picked on a separate graph, so that the timed one starts with a cold cache
+    probe=Graph(vertices, edges)
+    pairs=[(u, v) for u, v in random_pairs(vertices, rng) if probe.count_shortest_paths(u, v)<=MAX_PATHS_PER_QUERY]
+    graph=Graph(vertices, edges)
+    return(lambda: [graph.all_shortest_paths(u, v) for u, v in pairs])
+
+
+def setup_betweenness_centrality(vertices, edges, rng):
+    graph=Graph(vertices, edges)
+    node=rng.choice(vertices)
+    return(lambda: graph.betweenness_centrality(node))
+
+
+def setup_top_k_betweenness_centrality(vertices, edges, rng):
+    graph=Graph(vertices, edges)
+    return(graph.top_k_betweenness_centrality)
+
+
+OPERATIONS={
+    "init": setup_init,
+    "validate": setup_validate,
+    "min_dist": setup_min_dist,
+    "all_shortest_paths": setup_all_shortest_paths,
+    "betweenness_centrality": setup_betweenness_centrality,
+    "top_k_betweenness_centrality": setup_top_k_betweenness_centrality,
+}
+
+
+def measure(setup, vertices, edges, repeat, seed):
+    """
+    Times an operation on a fresh setup for every repetition
+
+    Returns:
+        Tuple of the best wall time in seconds, and the peak memory in bytes
+        allocated by one more run traced with tracemalloc
+    """
+    best=math.inf
+    for _ in range(repeat):
+        run=setup(vertices, edges, random.Random(seed))
+        gc.collect()
+        start=time.perf_counter()
+        run()
+        best=min(best, time.perf_counter()-start)
+    run=setup(vertices, edges, random.Random(seed))
+    gc.collect()
+    tracemalloc.start()
+    try:
+        run()
+        _, peak=tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return(best, peak)
+
+
+def scaling_exponent(points):
+    """
+    Least squares slope of log(seconds) against log(num_of_nodes)
+
+    Args:
+        points: List of (num_of_nodes, seconds) pairs
+
+    Returns:
+        The fitted exponent, or None with less than two usable points
+    """
+    points=[(math.log(n), math.log(t)) for n, t in points if n>0 and t>0]
+    if len(set(x for x, _ in points))<2:
+        return(None)
+    mean_x=sum(x for x, _ in points)/len(points)
+    mean_y=sum(y for _, y in points)/len(points)
+    sxx=sum((x-mean_x)**2 for x, _ in points)
+    sxy=sum((x-mean_x)*(y-mean_y) for x, y in points)
+    return(sxy/sxx)
+
+
+def run_suite(sizes, families, operations, repeat=3, seed=0, log=None, min_seconds=MIN_SECONDS):
+    """
+    Runs every operation on every family of graphs at every size
+
+    Returns:
+        Dictionary with the settings, a list of results (family, operation,
+        num_of_nodes, num_of_edges, seconds, peak_bytes) and the fitted
+        scaling exponent of every family/operation series, None for series
+        with a time below min_seconds
+    """
+    results=[]
+    for family in families:
+        for size in sizes:
+            vertices, edges=GENERATORS[family](size, seed=seed)
+            for operation in operations:
+                seconds, peak=measure(OPERATIONS[operation], vertices, edges, repeat, seed)
+                result={
+                    "family": family,
+                    "operation": operation,
+                    "num_of_nodes": len(vertices),
+                    "num_of_edges": len(edges),
+                    "seconds": seconds,
+                    "peak_bytes": peak,
+                }
+                results.append(result)
+                if log is not None:
+                    log(result)
+    exponents={}
+    for family in families:
+        for operation in operations:
+            points=[(r["num_of_nodes"], r["seconds"]) for r in results if r["family"]==family and r["operation"]==operation]
+            fitted=all(seconds>=min_seconds for _, seconds in points)
+            exponents["{}/{}".format(family, operation)]=scaling_exponent(points) if fitted else None
+    return({
+        "sizes": sizes,
+        "repeat": repeat,
+        "seed": seed,
+        "results": results,
+        "exponents": exponents,
+    })
+
+
+def compare(current, baseline, tolerance=0.5, exponent_tolerance=0.3, min_seconds=MIN_SECONDS):
+    """
+    Finds slowdowns of current with respect to baseline
+
+    A result is a regression if it is more than tolerance (relative) and
+    min_seconds (absolute) slower than the baseline result of the same family,
+    operation and size. A scaling exponent is a regression if it exceeds the
+    baseline exponent by more than exponent_tolerance, and is only compared
+    if no time of its series is below min_seconds in either suite.
+
+    Returns:
+        List of strings describing each regression
+    """
+    failures=[]
+    reference={(r["family"], r["operation"], r["num_of_nodes"]): r for r in baseline["results"]}
+    for r in current["results"]:
+        old=reference.get((r["family"], r["operation"], r["num_of_nodes"]))
+        if old is None:
+            continue
+        if r["seconds"]>old["seconds"]*(1+tolerance) and r["seconds"]-old["seconds"]>min_seconds:
+            failures.append("{} {} n={}: {:.4f}s, baseline {:.4f}s".format(
+                r["family"], r["operation"], r["num_of_nodes"], r["seconds"], old["seconds"]))
+    #Series with a time too short to fit, e.g. in a baseline from an older run
+    noisy=set("{}/{}".format(r["family"], r["operation"]) for r in current["results"]+baseline["results"] if r["seconds"]<min_seconds)
+    for series, exponent in current["exponents"].items():
+        old=baseline["exponents"].get(series)
+        if series in noisy:
+            continue
+        if exponent is not None and old is not None and exponent>old+exponent_tolerance:
+            failures.append("{} scales as n^{:.2f}, baseline n^{:.2f}".format(series, exponent, old))
+    return(failures)
+
+
+def print_result(result):
+    print("{:<16} {:<30} {:>7} {:>8} {:>11.4f}s {:>10.1f} KiB".format(
+        result["family"], result["operation"], result["num_of_nodes"], result["num_of_edges"],
+        result["seconds"], result["peak_bytes"]/1024))
+
+
+def main(argv=None):
+    parser=argparse.ArgumentParser(prog="python3 -m benchmarks", description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 200, 400],
+                        help="Numbers of vertices of the generated graphs")
+    parser.add_argument("--families", nargs="+", choices=sorted(GENERATORS), default=list(GENERATORS),
+                        help="Graph generators to use")
+    parser.add_argument("--operations", nargs="+", choices=list(OPERATIONS), default=list(OPERATIONS),
+                        help="Graph operations to time")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per measurement, the best is kept")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the generators and queries")
+    parser.add_argument("--output", help="Write the results as JSON to this file, e.g. to store a baseline")
+    parser.add_argument("--baseline", help="Compare with the results stored in this JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.5,
+                        help="Allowed relative slowdown with respect to the baseline")
+    parser.add_argument("--exponent-tolerance", type=float, default=0.3,
+                        help="Allowed increase of a scaling exponent with respect to the baseline")
+    parser.add_argument("--min-seconds", type=float, default=MIN_SECONDS,
+                        help="Times below this are neither flagged as regressions nor used to fit exponents")
+    args=parser.parse_args(argv)
+
+    print("{:<16} {:<30} {:>7} {:>8} {:>12} {:>14}".format("family", "operation", "nodes", "edges", "time", "peak memory"))
+    current=run_suite(args.sizes, args.families, args.operations, args.repeat, args.seed, log=print_result, min_seconds=args.min_seconds)
+    print()
+    for series, exponent in current["exponents"].items():
+        if exponent is not None:
+            print("{:<48} n^{:.2f}".format(series, exponent))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(current, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline=json.load(f)
+        failures=compare(current, baseline, args.tolerance, args.exponent_tolerance, args.min_seconds)
+        print()
+        if failures:
+            print("Regressions with respect to {}:".format(args.baseline))
+            for failure in failures:
+                print("  "+failure)
+            return(1)
+        print("No regressions with respect to {}".format(args.baseline))
+    return(0)
@@ -2,61 +2,893 @@
 # Author : Lakshya A Agrawal
 
 import re
-import itertools
-import copy
+import os
+import sys
+import json
+import zlib
+import struct
+import time
+import inspect
+import functools
+import contextlib
+import mmap as _mmap
+import math
+import bisect
+import heapq
+import random
+import multiprocessing
+import asyncio
+import argparse
+import signal
+from array import array
+from collections import Counter, OrderedDict
+from multiprocessing import shared_memory
+from concurrent.futures import ThreadPoolExecutor
+
+#Upper bound on the number of blocks BFS sources are split into for betweenness.
+#The block partial sums are always reduced in the same order, so the serial and
+#parallel engines give bit-identical results.
+_MAX_SOURCE_BLOCKS=64
+
+#Number of BFS sources advanced together by the bit-parallel multi-source BFS
+_BFS_BATCH=512
+
+#Metrics computed by Graph.centralities
+_METRICS=("betweenness", "edge_betweenness", "closeness", "harmonic", "stress", "eccentricity")
+
+#Binary graph files start with the magic bytes, then the format version and the
+#length of the JSON header as little endian 32 bit integers. The header is
+#followed by the array sections, each aligned to 8 bytes.
+#Edge list labels converted to integers, without sign or leading zeros that int() would drop
+_INTEGER_LABEL=re.compile(rb'0|-?[1-9][0-9]*')
+
+_FILE_MAGIC=b'NMGRAPH\0'
+_FILE_VERSION=2
+_FILE_PREAMBLE=struct.Struct('<8sII')
+
+
+class DistanceCache(object):
+    def __init__(self, max_rows=None, max_bytes=None):
+        """
+        Initializes a least recently used cache of BFS distance rows
+
+        Args:
+            max_rows: Maximum number of rows kept, None for no row limit
+            max_bytes: Maximum total size of the kept rows in bytes, None
+                for no memory limit
+        """
+        self.max_rows=max_rows
+        self.max_bytes=max_bytes
+        self.nbytes=0
+        self.hits=0
+        self.misses=0
+        self.evictions=0
+        self._rows=OrderedDict()
+        #CRC32 of the rows not checked yet, by key
+        self._checksums={}
+
+    def __len__(self):
+        return(len(self._rows))
+
+    def __contains__(self, key):
+        return(key in self._rows)
+
+    def get(self, key):
+        """
+        Looks up the row stored under key, marking it as most recently used
+
+        Returns:
+            The stored row, or None if key is not cached
+        """
+        row=self._rows.get(key)
+        if row is not None and not self._intact(key, row):
+            row=None
+        if row is None:
+            self.misses+=1
+            return(None)
+        self.hits+=1
+        self._rows.move_to_end(key)
+        return(row)
+
+    def put(self, key, row, checksum=None):
+        """
+        Stores row under key, evicting least recently used rows until the
+        cache is within its budget again. Rows larger than the whole memory
+        budget are not stored, and the row previously stored under key, if
+        any, is removed.
+
+        Args:
+            key: Key of the row
+            row: array or memoryview of the row
+            checksum: If not None, CRC32 the row is checked against on first
+                use, e.g. for a row lazily read from a file. A row that does
+                not match is dropped.
+        """
+        size=row.itemsize*len(row)
+        self.discard(key)
+        if self.max_bytes is not None and size>self.max_bytes:
+            return
+        self._rows[key]=row
+        if checksum is not None:
+            self._checksums[key]=checksum
+        self.nbytes+=size
+        while (self.max_rows is not None and len(self._rows)>self.max_rows) or \
+                (self.max_bytes is not None and self.nbytes>self.max_bytes):
+            old_key, old=self._rows.popitem(last=False)
+            self._checksums.pop(old_key, None)
+            self.nbytes-=old.itemsize*len(old)
+            self.evictions+=1
+
+    def items(self):
+        """
+        Returns:
+            List of the (key, row) pairs in the cache, least recently used
+            first, without counting as hits
+        """
+        return([(key, row) for key, row in list(self._rows.items()) if self._intact(key, row)])
+
+    def _intact(self, key, row):
+        """
+        Checks a row against its checksum on its first use, dropping it if
+        it does not match
+        """
+        checksum=self._checksums.pop(key, None)
+        if checksum is None or zlib.crc32(row)==checksum:
+            return(True)
+        self.discard(key)
+        return(False)
+
+    def discard(self, key):
+        """
+        Removes the row stored under key, if any
+        """
+        row=self._rows.pop(key, None)
+        self._checksums.pop(key, None)
+        if row is not None:
+            self.nbytes-=row.itemsize*len(row)
+
+    def clear(self):
+        """
+        Removes all rows, keeping the hit/miss statistics
+        """
+        self._rows.clear()
+        self._checksums.clear()
+        self.nbytes=0
+
+    def stats(self):
+        """
+        Returns:
+            Dictionary with the hit, miss and eviction counts, and the
+            number and total size of the cached rows
+        """
+        return({
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "rows": len(self._rows),
+            "bytes": self.nbytes,
+            "max_rows": self.max_rows,
+            "max_bytes": self.max_bytes,
+        })
+
+
+class GraphStats(object):
+    def __init__(self, cache):
+        """
+        Initializes counters of the work done by a Graph while profiled
+
+        Args:
+            cache: DistanceCache of the graph, whose hits and misses are
+                reported relative to the moment the counters were created
+        """
+        self.calls={}
+        self.seconds={}
+        self.bfs_runs=0
+        self.nodes_expanded=0
+        self.edges_expanded=0
+        self.paths_enumerated=0
+        self._cache=cache
+        self._cache_start=(cache.hits, cache.misses, cache.evictions)
+        self._cache_end=None
+
+    def record_call(self, name, seconds):
+        self.calls[name]=self.calls.get(name, 0)+1
+        self.seconds[name]=self.seconds.get(name, 0.0)+seconds
+
+    def stop(self):
+        """
+        Freezes the cache counters at their current values
+        """
+        cache=self._cache
+        self._cache_end=(cache.hits, cache.misses, cache.evictions)
+
+    def record_bfs(self, nodes, edges):
+        self.bfs_runs+=1
+        self.nodes_expanded+=nodes
+        self.edges_expanded+=edges
+
+    def as_dict(self):
+        """
+        Returns:
+            Dictionary of plain values, ready to be serialized: per method
+            call counts and cumulative (inclusive) seconds, BFS runs with the
+            nodes and edge endpoints they expanded, paths enumerated, and
+            distance cache hits, misses and evictions
+        """
+        hits, misses, evictions=self._cache_start
+        end=self._cache_end or (self._cache.hits, self._cache.misses, self._cache.evictions)
+        return({
+            "methods": {name: {"calls": self.calls[name], "seconds": self.seconds[name]} for name in sorted(self.calls)},
+            "bfs": {
+                "runs": self.bfs_runs,
+                "nodes_expanded": self.nodes_expanded,
+                "edges_expanded": self.edges_expanded,
+            },
+            "paths_enumerated": self.paths_enumerated,
+            "cache": {
+                "hits": end[0]-hits,
+                "misses": end[1]-misses,
+                "evictions": end[2]-evictions,
+            },
+        })
+
+    def to_json(self):
+        return(json.dumps(self.as_dict()))
+
+
+def _instrumented(method):
+    """
+    Decorator marking a Graph method whose calls and cumulative time are
+    recorded while the graph is profiled. The method itself is unchanged,
+    Graph.profile installs a wrapper from _timed on the profiled graph for
+    the duration of the block, so that calls outside of it cost nothing more.
+    """
+    method._instrumented=True
+    return(method)
+
+
+def _timed(graph, method):
+    """
+    Wraps a bound method of graph, recording its calls and cumulative time in
+    the GraphStats graph is profiled with. Generators are timed over their
+    whole iteration.
+    """
+    name=method.__name__
+    if inspect.isgeneratorfunction(method):
+        def timed(stats, generator):
+            elapsed=0.0
+            try:
+                while True:
+                    start=time.perf_counter()
+                    try:
+                        item=next(generator)
+                    finally:
+                        elapsed+=time.perf_counter()-start
+                    yield(item)
+            except StopIteration:
+                return
+            finally:
+                stats.record_call(name, elapsed)
+
+        @functools.wraps(method)
+        def generator_wrapper(*args, **kwargs):
+            return(timed(graph._stats, method(*args, **kwargs)))
+        return(generator_wrapper)
+
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        stats=graph._stats
+        start=time.perf_counter()
+        try:
+            return(method(*args, **kwargs))
+        finally:
+            stats.record_call(name, time.perf_counter()-start)
+    return(wrapper)
 
 
 class Graph(object):
-    def __init__ (self, vertices, edges):
+    def __init__ (self, vertices, edges, cache_rows=None, cache_bytes=64*1024*1024):
         """
         Initializes object for the class Graph
 
         Args:
-            vertices: List of integers specifying vertices in graph
-            edges: List of 2-tuples specifying edges in graph
-        """
-
-        self.vertices = vertices
-        
-        ordered_edges = list(map(lambda x: (min(x), max(x)), edges))
-        
-        self.edges    = ordered_edges
-        
-        #A dictionary of dictionary to store the distance of each point from each point, which has already been calculated
-        self.dist_from_point={}
-        
+            vertices: List of labels specifying vertices in graph, usually
+                integers. Labels can be of any hashable type.
+            edges: Iterable of 2-tuples specifying edges in graph
+            cache_rows: Maximum number of BFS distance rows kept by min_dist,
+                None for no row limit
+            cache_bytes: Maximum memory in bytes used by the kept BFS distance
+                rows, None for no memory limit
+
+        Raises:
+            Exception if the graph is not valid, see validate
+        """
+        self._init_state(vertices, cache_rows, cache_bytes)
+
+        #Endpoints of the edges as dense vertex indices
+        heads=array('i')
+        tails=array('i')
+        for u, v in edges:
+            i=self._index.get(u)
+            j=self._index.get(v)
+            if i is None or j is None:
+                raise Exception("All endpoints of edges must belong in vertices")
+            heads.append(i)
+            tails.append(j)
+
+        self._build_index(heads, tails)
+
         self.validate()
 
-    def validate(self):
+    def _init_state(self, vertices, cache_rows, cache_bytes, index=None):
         """
-        Validates if Graph if valid or not
+        Sets up everything but the adjacency of the graph
+
+        Args:
+            vertices: List of vertex labels
+            cache_rows: Row limit of the distance cache
+            cache_bytes: Memory limit of the distance cache
+            index: Dictionary from label to position in vertices, built
+                from vertices if None
+        """
+        #Copied, as the graph can be changed in place
+        self.vertices=list(vertices)
+
+        #Dense index of every vertex label, in the order of self.vertices
+        if index is None:
+            index={node: i for i, node in enumerate(vertices)}
+        self._index=index
+
+        #Distance rows of the BFS sources already explored, indexed by dense vertex index
+        self.dist_cache=DistanceCache(cache_rows, cache_bytes)
+
+        #Raw Brandes dependency sums of every node, computed on first use
+        self._betweenness=None
+
+        #GraphStats being recorded while profiled, and the last recorded ones
+        self._stats=None
+        self._last_stats=None
+
+    @contextlib.contextmanager
+    def profile(self):
+        """
+        Context manager recording the work done by the graph inside the block
+
+        Yields:
+            The GraphStats being recorded, which stay available through
+            stats() after the block
+        """
+        stats=GraphStats(self.dist_cache)
+        outer=self._stats
+        #Nested blocks record into their own stats through the wrappers of the outermost one
+        names=[name for name in dir(type(self)) if getattr(getattr(type(self), name), "_instrumented", False)] if outer is None else []
+        for name in names:
+            setattr(self, name, _timed(self, getattr(self, name)))
+        self._stats=stats
+        try:
+            yield(stats)
+        finally:
+            stats.stop()
+            self._stats=outer
+            self._last_stats=stats
+            for name in names:
+                delattr(self, name)
+
+    def stats(self):
+        """
+        Returns:
+            Dictionary of the counters of the profile block in progress, or
+            else of the last one, see GraphStats.as_dict. None if the graph
+            was never profiled.
+        """
+        stats=self._stats or self._last_stats
+        if stats is None:
+            return(None)
+        return(stats.as_dict())
+
+    def _record_row(self, row):
+        """
+        Records a BFS that produced the given distance row in the stats
+        """
+        offsets=self._offsets
+        nodes=0
+        edges=0
+        for v, d in enumerate(row):
+            if d>=0:
+                nodes+=1
+                edges+=offsets[v+1]-offsets[v]
+        self._stats.record_bfs(nodes, edges)
+
+    @classmethod
+    def from_edgelist(cls, path_or_file, delimiter=None, mmap=False, chunk_size=1<<20,
+                      cache_rows=None, cache_bytes=64*1024*1024):
+        """
+        Builds a graph from an edge list file, one edge per line
+
+        The file is read in chunks of chunk_size bytes, and edge endpoints
+        are stored as dense vertex indices in arrays as they are parsed, so
+        no list of edge tuples is ever built. Vertices are numbered in order
+        of first appearance. Empty lines and lines starting with # are
+        skipped, and columns after the first two (e.g. weights) are ignored.
+
+        Args:
+            path_or_file: Path of the file, or a file object opened for reading
+            delimiter: Column separator, None to split on whitespace and commas
+            mmap: If True and a path is given, read the file through a
+                read-only memory map instead of buffered reads
+            chunk_size: Number of bytes parsed at a time
+            cache_rows: Row limit of the distance cache, see __init__
+            cache_bytes: Memory limit of the distance cache, see __init__
+
+        Returns:
+            A Graph whose vertices are the labels found in the file, as
+            integers where they are integer literals and strings otherwise
 
         Raises:
-            Exception if:
-                - vertices contains duplicates
-                - edges contain duplicates
-                - any endpoint of an edge is not in vertices
+            Exception if a line has less than two columns, or if the graph is
+            not valid, see validate
         """
+        if isinstance(delimiter, str):
+            delimiter=delimiter.encode()
+        labels=[]
+        index={}
+        heads=array('i')
+        tails=array('i')
 
-        if not all([isinstance(node, int) for node in self.vertices]):
-            raise Exception("All vertices should be integers")
+        def vertex_id(token):
+            label=_parse_label(token)
+            i=index.get(label)
+            if i is None:
+                i=index[label]=len(labels)
+                labels.append(label)
+            return(i)
 
-        elif len(self.vertices) != len(set(self.vertices)):
-            duplicate_vertices = set([node for node in self.vertices if self.vertices.count(node) > 1])
+        def parse(lines):
+            for line in lines:
+                line=line.strip()
+                if not line or line.startswith(b'#'):
+                    continue
+                if delimiter is None:
+                    columns=line.replace(b',', b' ').split()
+                else:
+                    columns=[column.strip() for column in line.split(delimiter)]
+                if len(columns)<2:
+                    raise Exception("Edge list lines need two columns: {!r}".format(line.decode(errors='replace')))
+                heads.append(vertex_id(columns[0]))
+                tails.append(vertex_id(columns[1]))
+
+        rest=b''
+        for chunk in _read_chunks(path_or_file, mmap, chunk_size):
+            lines=(rest+chunk).split(b'\n')
+            #The last line may continue in the next chunk
+            rest=lines.pop()
+            parse(lines)
+        parse([rest])
+
+        graph=cls.__new__(cls)
+        graph._init_state(labels, cache_rows, cache_bytes, index)
+        graph._build_index(heads, tails)
+        graph.validate()
+        return(graph)
 
-            raise Exception("Vertices contain duplicates.\nVertices: {}\nDuplicate vertices: {}".format(vertices, duplicate_vertices))
+    @classmethod
+    def load(cls, path, mmap=True, verify=False, cache_rows=None, cache_bytes=64*1024*1024):
+        """
+        Loads a graph written by save, without validating it again
+
+        Args:
+            path: Path of the file
+            mmap: If True, the adjacency and the cached distance rows are
+                read-only views of a memory map of the file, so only the
+                parts actually used are read from disk. The graph is copied
+                into memory on its first change.
+            verify: If True, also check the checksum of the adjacency, which
+                reads all of it. Saved distance rows are checked one by one
+                when they are first used, and saved betweenness on load.
+            cache_rows: Row limit of the distance cache, see __init__
+            cache_bytes: Memory limit of the distance cache, see __init__
+
+        Returns:
+            The loaded Graph. Saved betweenness and distance rows are only
+            used if their checksums match.
+
+        Raises:
+            Exception if the file is not a graph file of a supported version,
+            or verify is True and the adjacency is corrupted
+        """
+        with open(path, 'rb') as f:
+            magic, version, header_len=_FILE_PREAMBLE.unpack(f.read(_FILE_PREAMBLE.size))
+            if magic!=_FILE_MAGIC:
+                raise Exception("{} is not a graph file".format(path))
+            if version not in (1, _FILE_VERSION):
+                raise Exception("Unsupported graph file version {} in {}".format(version, path))
+            header=json.loads(f.read(header_len).decode())
+            data_start=_align8(_FILE_PREAMBLE.size+header_len)
+            swap=header["byteorder"]!=sys.byteorder
+            if mmap and not swap:
+                buf=memoryview(_mmap.mmap(f.fileno(), 0, access=_mmap.ACCESS_READ))
+            else:
+                f.seek(0)
+                buf=memoryview(f.read())
 
-        edge_vertices = list(set(itertools.chain(*self.edges)))
+        def section(name):
+            offset, count, typecode, _=header["sections"][name]
+            start=data_start+offset
+            view=buf[start:start+count*array(typecode).itemsize]
+            if not mmap or swap:
+                copy=array(typecode)
+                copy.frombytes(view)
+                if swap:
+                    copy.byteswap()
+                return(copy)
+            return(view.cast(typecode))
 
-        if not all([node in self.vertices for node in edge_vertices]):
+        def intact(name):
+            offset, count, typecode, crc=header["sections"][name]
+            start=data_start+offset
+            return(zlib.crc32(buf[start:start+count*array(typecode).itemsize])==crc)
+
+        if verify and not (intact("offsets") and intact("targets")):
+            raise Exception("Adjacency of {} does not match its checksum".format(path))
+
+        num_of_nodes=header["num_of_nodes"]
+        labels=header["labels"]
+        if labels is None:
+            labels=list(range(num_of_nodes))
+        graph=cls.__new__(cls)
+        graph._init_state(labels, cache_rows, cache_bytes)
+        graph._offsets=section("offsets")
+        graph._targets=section("targets")
+
+        #Results damaged on disk are dropped
+        if "betweenness" in header["sections"] and intact("betweenness"):
+            graph._betweenness=array('d', section("betweenness"))
+        if "distances" in header["sections"]:
+            rows=section("distances")
+            if "distance_checksums" in header["sections"]:
+                checksums=section("distance_checksums") if intact("distance_checksums") else []
+            else:
+                #Version 1 files only have a checksum of all rows
+                checksums=[None]*len(header["distance_sources"]) if intact("distances") else []
+            for k, (source, checksum) in enumerate(zip(header["distance_sources"], checksums)):
+                graph.dist_cache.put(source, rows[k*num_of_nodes:(k+1)*num_of_nodes], checksum)
+        return(graph)
+
+    @_instrumented
+    def save(self, path):
+        """
+        Writes the graph and its computed results to a binary file
+
+        The file holds the CSR adjacency, the vertex labels, the cached
+        betweenness and the cached BFS distance rows, with a CRC32 checksum
+        per section and per distance row. It is written to a temporary file first and then
+        renamed, so an interrupted save never leaves a partial file at path.
+
+        Args:
+            path: Path of the file
+
+        Raises:
+            Exception if the vertex labels are not all integers or strings
+        """
+        num_of_nodes=len(self.vertices)
+        if self.vertices==list(range(num_of_nodes)):
+            labels=None
+        elif all(isinstance(node, (int, str)) for node in self.vertices):
+            labels=self.vertices
+        else:
+            raise Exception("Only graphs with integer or string vertices can be saved")
+
+        cached=self.dist_cache.items()
+        sections=[("offsets", 'i', [self._offsets]), ("targets", 'i', [self._targets])]
+        if self._betweenness is not None:
+            sections.append(("betweenness", 'd', [self._betweenness]))
+        if cached:
+            checksums=array('I', [zlib.crc32(row) for _, row in cached])
+            sections.append(("distance_checksums", 'I', [checksums]))
+            sections.append(("distances", 'i', [row for _, row in cached]))
+
+        layout={}
+        offset=0
+        for name, typecode, parts in sections:
+            count=sum(len(part) for part in parts)
+            crc=0
+            for part in parts:
+                crc=zlib.crc32(part, crc)
+            layout[name]=[offset, count, typecode, crc]
+            offset=_align8(offset+count*array(typecode).itemsize)
+        #The file ends with the last section, without padding
+        size=max(start+count*array(typecode).itemsize for start, count, typecode, _ in layout.values())
+        header=json.dumps({
+            "num_of_nodes": num_of_nodes,
+            "byteorder": sys.byteorder,
+            "labels": labels,
+            "sections": layout,
+            "distance_sources": [source for source, _ in cached],
+        }).encode()
+
+        data_start=_align8(_FILE_PREAMBLE.size+len(header))
+        tmp_path="{}.tmp{}".format(path, os.getpid())
+        with open(tmp_path, 'wb') as f:
+            f.write(_FILE_PREAMBLE.pack(_FILE_MAGIC, _FILE_VERSION, len(header)))
+            f.write(header)
+            for name, typecode, parts in sections:
+                f.seek(data_start+layout[name][0])
+                for part in parts:
+                    f.write(part)
+            f.truncate(data_start+size)
+        os.replace(tmp_path, path)
+
+    def _ensure_writable(self):
+        """
+        Copies the adjacency into memory if it is a read-only view of a
+        loaded file, before it is changed
+        """
+        if not isinstance(self._offsets, array):
+            self._offsets=array('i', self._offsets)
+            self._targets=array('i', self._targets)
+
+    @property
+    def edges(self):
+        """
+        List of 2-tuples of the edges in graph, generated from the adjacency.
+        Each edge is (min, max) of its endpoints, or in the order they have in
+        vertices if they cannot be compared. Edges are listed by the position
+        in vertices of their first endpoint in that order, then of the second,
+        not in the order they were given.
+        """
+        vertices=self.vertices
+        offsets=self._offsets
+        targets=self._targets
+        edges=[]
+        for i in range(len(vertices)):
+            for j in targets[offsets[i]:offsets[i+1]]:
+                if j>=i:
+                    a, b=vertices[i], vertices[j]
+                    try:
+                        if b<a:
+                            a, b=b, a
+                    except TypeError:
+                        pass
+                    edges.append((a, b))
+        return(edges)
+
+    def _build_index(self, heads, tails):
+        """
+        Builds the compressed sparse row (CSR) adjacency of the graph
+
+        Vertices are relabeled to dense indices in the order of self.vertices.
+        The neighbours of the vertex with index i are the sorted indices
+        self._targets[self._offsets[i]:self._offsets[i+1]].
+
+        Args:
+            heads: array of the dense indices of the first endpoint of every edge
+            tails: array of the dense indices of the second endpoint of every edge
+        """
+        num_of_nodes=len(self.vertices)
+
+        #Count degrees, shifted by one so that a prefix sum gives row offsets
+        offsets=array('i', bytes(4*(num_of_nodes+1)))
+        for i, j in zip(heads, tails):
+            offsets[i+1]+=1
+            if i!=j:
+                offsets[j+1]+=1
+        for i in range(num_of_nodes):
+            offsets[i+1]+=offsets[i]
+
+        targets=array('i', bytes(4*offsets[num_of_nodes]))
+        fill=offsets[:num_of_nodes]
+        for i, j in zip(heads, tails):
+            targets[fill[i]]=j
+            fill[i]+=1
+            if i!=j:
+                targets[fill[j]]=i
+                fill[j]+=1
+        for i in range(num_of_nodes):
+            lo, hi=offsets[i], offsets[i+1]
+            if hi-lo>1:
+                targets[lo:hi]=array('i', sorted(targets[lo:hi]))
+
+        self._offsets=offsets
+        self._targets=targets
+
+    def has_edge(self, u, v):
+        """
+        Checks if the edge (u, v) is in the graph, by binary search in the
+        sorted neighbour row of u
+
+        Args:
+            u: One endpoint of the edge
+            v: The other endpoint of the edge
+
+        Returns:
+            True if the edge is present, False otherwise
+        """
+        i=self._index.get(u)
+        j=self._index.get(v)
+        if i is None or j is None:
+            return(False)
+        hi=self._offsets[i+1]
+        k=bisect.bisect_left(self._targets, j, self._offsets[i], hi)
+        return(k<hi and self._targets[k]==j)
+
+    @_instrumented
+    def add_vertex(self, node):
+        """
+        Adds an isolated vertex to the graph
+
+        Cached distance rows are extended with the new, unreachable vertex,
+        and cached betweenness is kept, as no shortest path goes through it.
+
+        Args:
+            node: Label of the new vertex
+
+        Raises:
+            Exception if node is already in vertices
+        """
+        if node in self._index:
+            raise Exception("Vertex {} is already in the graph".format(node))
+        self._ensure_writable()
+        self._index[node]=len(self.vertices)
+        self.vertices.append(node)
+        self._offsets.append(self._offsets[-1])
+        for source, row in self.dist_cache.items():
+            row=array('i', row)
+            row.append(-1)
+            self.dist_cache.put(source, row)
+        if self._betweenness is not None:
+            self._betweenness.append(0.0)
+
+    @_instrumented
+    def add_edge(self, u, v):
+        """
+        Adds the edge (u, v) to the graph, updating the adjacency in place
+
+        Cached distance rows are repaired by a BFS from the endpoint that got
+        closer to the source, which only visits the vertices whose distance
+        decreases. Cached betweenness is repaired for the sources for which u
+        and v are at different distances only, as for all other sources the
+        new edge is on no shortest path. See _repair_dependencies for the cost
+        of a repaired source.
+
+        Args:
+            u: One endpoint of the edge
+            v: The other endpoint of the edge
+
+        Raises:
+            Exception if an endpoint is not in vertices or the edge already
+            exists
+        """
+        if u not in self._index or v not in self._index:
             raise Exception("All endpoints of edges must belong in vertices")
+        i, j=self._index[u], self._index[v]
+        if self.has_edge(u, v):
+            raise Exception("Edge {} is already in the graph".format(self._edge(i, j)))
+        affected=None
+        if self._betweenness is not None:
+            #d(s, u) and d(s, v) for every source s, by symmetry of undirected distances
+            row_u, row_v=self._distance_row(i), self._distance_row(j)
+            affected=_edge_side(row_u, row_v)
+
+        self._ensure_writable()
+        self._insert_target(i, j)
+        if i!=j:
+            self._insert_target(j, i)
+
+        for source, row in self.dist_cache.items():
+            near, far=(i, j) if 0<=row[i] and (row[j]<0 or row[i]<row[j]) else (j, i)
+            if row[near]<0 or (0<=row[far]<=row[near]+1):
+                continue
+            row=array('i', row)
+            row[far]=row[near]+1
+            frontier=[far]
+            for x in frontier:
+                d=row[x]+1
+                for w in self._targets[self._offsets[x]:self._offsets[x+1]]:
+                    if row[w]<0 or row[w]>d:
+                        row[w]=d
+                        frontier.append(w)
+            self.dist_cache.put(source, row)
+
+        if affected:
+            _repair_dependencies(self._offsets, self._targets, affected, i, j, 1, self._betweenness, self._stats)
+
+    @_instrumented
+    def remove_edge(self, u, v):
+        """
+        Removes the edge (u, v) from the graph, updating the adjacency in place
+
+        A cached distance row is dropped only if the edge led to the only
+        neighbour of the farther endpoint one step closer to the source.
+        Cached betweenness is repaired for the sources whose shortest path
+        DAG contains the edge only, i.e. those for which u and v are at
+        distances differing by one, see _repair_dependencies.
+
+        Args:
+            u: One endpoint of the edge
+            v: The other endpoint of the edge
+
+        Raises:
+            Exception if the edge is not in the graph
+        """
+        if not self.has_edge(u, v):
+            raise Exception("Edge {} is not in the graph".format((u, v)))
+        i, j=self._index[u], self._index[v]
+        if self._betweenness is not None:
+            row_u, row_v=self._distance_row(i), self._distance_row(j)
+            affected=_edge_side(row_u, row_v)
+            #The repair runs while the edge is still in the adjacency
+            if affected:
+                self._ensure_writable()
+                _repair_dependencies(self._offsets, self._targets, affected, i, j, -1, self._betweenness, self._stats)
+
+        self._ensure_writable()
+        self._remove_target(i, j)
+        if i!=j:
+            self._remove_target(j, i)
+
+        for source, row in self.dist_cache.items():
+            if abs(row[i]-row[j])!=1:
+                continue
+            far=i if row[i]>row[j] else j
+            d=row[far]-1
+            if not any(row[w]==d for w in self._targets[self._offsets[far]:self._offsets[far+1]]):
+                self.dist_cache.discard(source)
+
+
+    def _insert_target(self, i, j):
+        """
+        Inserts j into the sorted CSR row of i
+        """
+        lo, hi=self._offsets[i], self._offsets[i+1]
+        self._targets.insert(bisect.bisect_left(self._targets, j, lo, hi), j)
+        for k in range(i+1, len(self._offsets)):
+            self._offsets[k]+=1
+
+    def _remove_target(self, i, j):
+        """
+        Removes j from the sorted CSR row of i
+        """
+        lo, hi=self._offsets[i], self._offsets[i+1]
+        self._targets.pop(bisect.bisect_left(self._targets, j, lo, hi))
+        for k in range(i+1, len(self._offsets)):
+            self._offsets[k]-=1
+
+    def validate(self):
+        """
+        Validates if Graph if valid or not, in time linear in the size of the
+        graph
+
+        Raises:
+            Exception if:
+                - vertices contains duplicates
+                - edges contain duplicates
+        """
+        if len(self._index)!=len(self.vertices):
+            counts=Counter(self.vertices)
+            duplicate_vertices=set(node for node, count in counts.items() if count>1)
+
+            raise Exception("Vertices contain duplicates.\nVertices: {}\nDuplicate vertices: {}".format(self.vertices, duplicate_vertices))
+
+        #Rows are sorted, so a duplicate edge shows up as a repeated neighbour
+        duplicate_edges=set()
+        for i in range(len(self.vertices)):
+            row=self._targets[self._offsets[i]:self._offsets[i+1]]
+            for k in range(1, len(row)):
+                if row[k]==row[k-1]:
+                    duplicate_edges.add(self._edge(i, row[k]))
 
-        if len(self.edges) != len(set(self.edges)):
-            duplicate_edges = set([edge for edge in self.edges if self.edges.count(edge) > 1])
+        if duplicate_edges:
+            raise Exception("Edges contain duplicates.\nEdges: {}\nDuplicate edges: {}".format(self.edges, duplicate_edges))
 
-            raise Exception("Edges contain duplicates.\nEdges: {}\nDuplicate vertices: {}".format(edges, duplicate_edges))
+    def _edge(self, i, j):
+        """
+        Returns the edge between the vertices with indices i and j as a
+        2-tuple of labels, in the order of self.vertices
+        """
+        return((self.vertices[min(i, j)], self.vertices[max(i, j)]))
 
-    def min_dist(self, start_node, end_node, visited=[], explored=[], unvisited=[], dist=0):
+    @_instrumented
+    def min_dist(self, start_node, end_node):
         '''
         Finds minimum distance between start_node and end_node
 
@@ -67,52 +899,79 @@ class Graph(object):
 
         Returns:
             An integer denoting minimum distance between start_node
-            and end_node
+            and end_node, or None if end_node cannot be reached
         '''
-        #print("in " + str(dist)+" visited " + str(visited))
-        
-        #Checks if the distance has already been calculated, also acts as a base case
-        if start_node in self.dist_from_point:
-            if end_node in self.dist_from_point[start_node]:
-                return(self.dist_from_point[start_node][end_node])
-        
-        #the first call to the function
-        if dist==0:
-            unvisited=copy.deepcopy(self.vertices)
-            if not (start_node in self.dist_from_point):
-                self.dist_from_point[start_node]={}
-            unvisited.remove(start_node)
-            visited=[]
-            explored=[]
-            visited.append(start_node)
-            return(self.min_dist(start_node, end_node, visited, explored, unvisited, dist+1))
-        else:
-            #all other calls, implements BFS
-            to_rem_vis=[]
-            to_add_vis=[]
-            for i in visited:
-                #print("Exploring "+str(i))
-                #print("going through "+str(i))
-                to_rem_un=[]
-                for j in unvisited:
-                    if (min(i,j), max(i, j)) in self.edges:
-                        #print("Visiting " + str(j))
-                        #print("distance of "+str(j) + " " + str(dist))
-                        if not j in self.dist_from_point[start_node]:
-                            self.dist_from_point[start_node][j]=dist
-                        to_rem_un.append(j)
-                        to_add_vis.append(j)
-                        #print("visited "+str(j))
-                for t in to_rem_un:
-                    unvisited.remove(t)
-                to_rem_vis.append(i)
-                explored.append(i)
-                #print("Explored " + str(i))
-            for z in to_rem_vis:
-                visited.remove(z)
-            for a in to_add_vis:
-                visited.append(a)
-            return(self.min_dist(start_node, end_node, visited, explored, unvisited, dist+1))
+        dist=self._distance_row(self._index[start_node])[self._index[end_node]]
+        if dist<0:
+            return(None)
+        return(dist)
+
+    def _distance_row(self, source):
+        """
+        Returns the BFS distances from the vertex with index source to every
+        vertex, going through the distance cache
+        """
+        row=self.dist_cache.get(source)
+        if row is None:
+            row=_bfs(self._offsets, self._targets, source)
+            if self._stats is not None:
+                self._record_row(row)
+            self.dist_cache.put(source, row)
+        return(row)
+
+    @_instrumented
+    def distances_from(self, sources):
+        """
+        Finds BFS distances from many sources at once
+
+        The sources are advanced together by a bit-parallel BFS: every vertex
+        holds an integer bitmask of the sources that reached it, so each
+        level scans the edges out of the frontier once for the whole batch
+        instead of once per source. Rows already in the distance cache are
+        reused, and computed rows are added to it.
+
+        Args:
+            sources: List of vertices to find distances from
+
+        Returns:
+            List of array('i') rows, one per source, where the i-th entry of
+            a row is the distance from the source to self.vertices[i], or -1
+            if self.vertices[i] cannot be reached
+        """
+        indices=[self._index[node] for node in sources]
+        rows={}
+        missing=[]
+        for i in indices:
+            if i in rows:
+                continue
+            row=self.dist_cache.get(i)
+            if row is None:
+                missing.append(i)
+                rows[i]=None
+            else:
+                rows[i]=row
+        for lo in range(0, len(missing), _BFS_BATCH):
+            batch=missing[lo:lo+_BFS_BATCH]
+            for i, row in zip(batch, _multi_source_bfs(self._offsets, self._targets, batch)):
+                if self._stats is not None:
+                    self._record_row(row)
+                rows[i]=row
+                self.dist_cache.put(i, row)
+        return([rows[i] for i in indices])
+
+    @_instrumented
+    def distance_matrix(self):
+        """
+        Finds the distance between every pair of vertices
+
+        Returns:
+            List of array('i') rows, where entry j of row i is the distance
+            from self.vertices[i] to self.vertices[j], or -1 if it cannot be
+            reached
+        """
+        return(self.distances_from(self.vertices))
+
+    @_instrumented
     def all_shortest_paths(self, start_node, end_node):
         """
         Finds all shortest paths between start_node and end_node
@@ -123,22 +982,101 @@ class Graph(object):
 
         Returns:
             A list of path, where each path is a list of integers.
+
+            Returns None if end_node cannot be reached
+        """
+        paths=list(self.iter_shortest_paths(start_node, end_node))
+        if len(paths)==0:
+            return(None)
+        return(paths)
+
+    @_instrumented
+    def iter_shortest_paths(self, start_node, end_node):
+        """
+        Lazily generates all shortest paths between start_node and end_node
+
+        The predecessor DAG of the paths is given by the BFS distance row of
+        end_node: from every node, the next hops are its neighbours one step
+        closer to end_node. Paths are generated by a depth first walk of this
+        DAG, so only the path being built is held in memory.
+
+        Args:
+            start_node: Starting node for paths
+            end_node: Destination node for paths
+
+        Yields:
+            Each path as a list of integers, in lexicographic order of the
+            vertex indices along the path
+        """
+        s=self._index[start_node]
+        t=self._index[end_node]
+        row=self._distance_row(t)
+        if row[s]<0:
+            return
+        if s==t:
+            yield([start_node])
+            return
+        path=[s]
+        stack=[iter(self._next_hops(row, s))]
+        while stack:
+            w=next(stack[-1], None)
+            if w is None:
+                stack.pop()
+                path.pop()
+            elif w==t:
+                if self._stats is not None:
+                    self._stats.paths_enumerated+=1
+                yield([self.vertices[v] for v in path]+[end_node])
+            else:
+                path.append(w)
+                stack.append(iter(self._next_hops(row, w)))
+
+    @_instrumented
+    def count_shortest_paths(self, start_node, end_node):
+        """
+        Counts the shortest paths between start_node and end_node without
+        generating them
+
+        Args:
+            start_node: Starting node for paths
+            end_node: Destination node for paths
+
+        Returns:
+            An integer denoting the number of shortest paths, 0 if end_node
+            cannot be reached
+        """
+        s=self._index[start_node]
+        t=self._index[end_node]
+        row=self._distance_row(t)
+        if row[s]<0:
+            return(0)
+        #Number of shortest paths from s to each node of the current level of the DAG
+        sigma={s: 1}
+        while t not in sigma:
+            next_sigma={}
+            for v, count in sigma.items():
+                for w in self._next_hops(row, v):
+                    next_sigma[w]=next_sigma.get(w, 0)+count
+            sigma=next_sigma
+        return(sigma[t])
+
+    def _next_hops(self, row, v):
+        """
+        Returns the neighbours of the vertex with index v that are one step
+        closer to the source of the distance row
         """
-        min_dis_bw_points=self.min_dist(start_node, end_node)
-        return(self.all_paths(start_node, end_node, min_dis_bw_points))
+        d=row[v]-1
+        return([w for w in self._targets[self._offsets[v]:self._offsets[v+1]] if row[w]==d])
+
     def neighbours(self, node):
         '''
         From the graph, returns a list of neighbours for the given node
         '''
-        a=[]
-        for i in self.edges:
-            if node==i[0]:
-                a.append(i[1])
-            elif node==i[1]:
-                a.append(i[0])
-        return(a)
+        i=self._index[node]
+        return([self.vertices[j] for j in self._targets[self._offsets[i]:self._offsets[i+1]]])
 
-    def all_paths(self, start_node, end_node, distance, paths=[], visited=[], explored=[], unvisited=[], dist=-1):
+    @_instrumented
+    def all_paths(self, start_node, end_node, distance):
         """
         Finds all paths from node to destination with length = dist
 
@@ -146,137 +1084,1304 @@ class Graph(object):
             node: Node to find path from
             destination: Node to reach
             dist: Allowed distance of path
-            path: path already traversed
 
         Returns:
             List of path, where each path is list ending on destination
 
             Returns None if there no paths
         """
-        #print("in " + str(dist))
-        #print("visited " + str(visited))
-        
-        #Base Case
-        if dist>(distance-1):
-            a=[]
-            for i in paths:
-                if i[-1]==end_node:
-                    a.append(i)
-            if len(a)==0:
-                return(None)
-            return(a)
-        
-        #First Call
-        if dist==-1:
-            unvisited=copy.deepcopy(self.vertices)
-            unvisited.remove(start_node)
-            visited=[]
-            explored=[]
-            visited.append(start_node)
-            new_paths=[[start_node]]
-            return(self.all_paths(start_node, end_node, distance, new_paths, visited, explored, unvisited, dist+1))
-        else:
-            #All other calls
-            to_rem_vis=[]
-            to_add_vis=[]
-            #print("visited " + str(visited))
-            #print("visited " + str(visited))
-            #print("unvisited " + str(unvisited))
-            #print("explored " + str(explored))
-            new_paths=[]
-            for i in visited:
-                #print("checking for neighbours of "+str(i))
-                #print(new_paths)
-                list_of_neighbours=self.neighbours(i)
-                #print("neighbours of "+str(i)+" "+str(list_of_neighbours))
-                to_rem_un=[]
-                for neighbour in list_of_neighbours:
-                    neigh_rev=self.neighbours(neighbour)
-                    for neighbour_of_neighbour in neigh_rev:
-                        for path in paths:
-                            if path[-1]==neighbour_of_neighbour:
-                                if not neighbour in path:
-                                    if not path+[neighbour] in new_paths:
-                                        #Append the path if the node being added is not already present in the path, so as to ensure looped paths are rejected
-                                        new_paths.append(path+[neighbour])
-                    if neighbour in unvisited:
-                        to_rem_un.append(neighbour)
-                        to_add_vis.append(neighbour)
-                #print("Exploring "+str(i))
-                #print("going through "+str(i))
-                for t in to_rem_un:
-                    unvisited.remove(t)
-                to_rem_vis.append(i)
-                explored.append(i)
-                
-                #This is done so that paths can be generated to reach any node in a given number of steps
-                unvisited.append(i)
-                #print("Explored " + str(i))
-            for z in to_rem_vis:
-                visited.remove(z)
-            for a in to_add_vis:
-                visited.append(a)
-            #print("in "+ str(dist) + " paths " + str(new_paths))
-            return(self.all_paths(start_node, end_node, distance, new_paths, visited, explored, unvisited, dist+1))
-
-    def betweenness_centrality(self, node):
+        paths=list(self.iter_paths(start_node, end_node, distance))
+        if len(paths)==0:
+            return(None)
+        return(paths)
+
+    @_instrumented
+    def iter_paths(self, start_node, end_node, distance):
+        """
+        Lazily generates all paths without repeated nodes from start_node to
+        end_node with exactly distance edges
+
+        Branches are pruned as soon as end_node can no longer be reached in
+        the remaining number of steps, using the BFS distance row of end_node.
+
+        Args:
+            start_node: Starting node for paths
+            end_node: Destination node for paths
+            distance: Number of edges of every path
+
+        Yields:
+            Each path as a list of integers
+        """
+        s=self._index[start_node]
+        t=self._index[end_node]
+        row=self._distance_row(t)
+        if row[s]<0 or row[s]>distance:
+            return
+        if distance==0:
+            yield([start_node])
+            return
+
+        def steps(v, remaining):
+            return([w for w in self._targets[self._offsets[v]:self._offsets[v+1]]
+                    if 0<=row[w]<remaining and not on_path[w]])
+
+        on_path=bytearray(len(self.vertices))
+        on_path[s]=1
+        path=[s]
+        stack=[iter(steps(s, distance))]
+        while stack:
+            w=next(stack[-1], None)
+            if w is None:
+                stack.pop()
+                on_path[path.pop()]=0
+            elif w==t:
+                if len(path)==distance:
+                    if self._stats is not None:
+                        self._stats.paths_enumerated+=1
+                    yield([self.vertices[v] for v in path]+[end_node])
+            elif len(path)<distance:
+                path.append(w)
+                on_path[w]=1
+                stack.append(iter(steps(w, distance-len(path)+1)))
+
+    @_instrumented
+    def connected_components(self):
+        """
+        Splits the graph into connected components
+
+        Returns:
+            List of lists of nodes, one per component, with the nodes and the
+            components in the order of self.vertices
+        """
+        members={}
+        for v, c in enumerate(_components(self._offsets, self._targets)):
+            members.setdefault(c, []).append(self.vertices[v])
+        return(list(members.values()))
+
+    @_instrumented
+    def biconnected_components(self):
+        """
+        Splits the graph into biconnected blocks, i.e. maximal subgraphs that
+        stay connected when any single node is removed. Every edge is in
+        exactly one block, bridges forming blocks of two nodes, and two blocks
+        share at most one node, an articulation point. Isolated nodes are in
+        no block.
+
+        Returns:
+            List of lists of nodes, one per block, with the nodes of a block
+            in the order of self.vertices
+        """
+        return([[self.vertices[v] for v in sorted(nodes)] for nodes, _ in _biconnected(self._offsets, self._targets)])
+
+    @_instrumented
+    def articulation_points(self):
+        """
+        Finds the nodes whose removal disconnects their component
+
+        Returns:
+            List of nodes, in the order of self.vertices
+        """
+        count=Counter(v for nodes, _ in _biconnected(self._offsets, self._targets) for v in nodes)
+        return([self.vertices[v] for v in sorted(count) if count[v]>1])
+
+    @_instrumented
+    def betweenness_centrality(self, node, workers=None, blocks=False):
         """
         Find betweenness centrality of the given node
 
         Args:
             node: Node to find betweenness centrality of.
+            workers: Number of processes to split BFS sources across,
+                None or 1 to compute in this process, see
+                all_betweenness_centrality
+            blocks: If True, compute betweenness block by block, see
+                all_betweenness_centrality
 
         Returns:
             Single floating point number, denoting standardized betweenness centrality
             of the given node
         """
+        scores=self.all_betweenness_centrality(workers, blocks)
+        return(scores[self._index[node]])
+
+    @_instrumented
+    def all_betweenness_centrality(self, workers=None, blocks=False):
+        """
+        Finds standardized betweenness centrality of every node in a single
+        Brandes pass, i.e. one BFS and one dependency accumulation per source.
+
+        The raw dependency sums are computed once and kept on the object, so
+        later calls only rescale them. Nodes in different connected components
+        are joined by no shortest path, and contribute nothing to each other.
+
+        Args:
+            workers: Number of processes to split BFS sources across,
+                None or 1 to compute in this process. The adjacency is shared
+                with the workers through shared memory, and the result is
+                identical to the one computed in this process. The workers
+                are started from a fork server, or spawned, and import the
+                __main__ module of the caller, so a script using them must
+                run them under if __name__ == "__main__":, see _pool_context.
+            blocks: If True, run the Brandes passes inside every biconnected
+                block instead of the whole graph, in this process, see
+                _block_brandes. Each BFS then only covers its block, which
+                pays off on graphs with many articulation points. The scores
+                equal the ones of the whole graph passes up to floating point
+                round-off.
+
+        Returns:
+            List of floating point numbers, where the i-th entry is the
+            standardized betweenness centrality of self.vertices[i]
+        """
+        if self._betweenness is None:
+            if blocks:
+                self._betweenness=_block_brandes(self._offsets, self._targets, self._stats)
+            elif workers is None or workers<=1:
+                source_blocks=_source_blocks(len(self.vertices))
+                partials=(_brandes(self._offsets, self._targets, block, self._stats) for block in source_blocks)
+                self._betweenness=_reduce_partials(len(self.vertices), partials)
+            else:
+                self._betweenness=_parallel_brandes(self._offsets, self._targets, _source_blocks(len(self.vertices)), workers)
         num_of_nodes=len(self.vertices)
-        bc=0
-        for i in range(0,num_of_nodes):
-            if self.vertices[i]==node:
-                continue
-            for j in range(i+1, num_of_nodes):
-                if self.vertices[j]==node:
-                    continue
-                #print(i,j,num_of_nodes)
-                shortest_paths=self.all_shortest_paths(self.vertices[i], self.vertices[j])
-                num_of_shortest_passing_through_node=0
-                num_of_paths=0
-                for path in shortest_paths:
-                    if node in path:
-                        num_of_shortest_passing_through_node+=1
-                    num_of_paths+=1
-                bc+=(num_of_shortest_passing_through_node/num_of_paths)
-        sbc=(2*bc)/((num_of_nodes-1)*(num_of_nodes-2))
-        return(sbc)
-
-    def top_k_betweenness_centrality(self):
+        #Every unordered pair is counted once from each of its endpoints, over the whole graph
+        scale=(num_of_nodes-1)*(num_of_nodes-2)
+        return([bc/scale for bc in self._betweenness])
+
+    @_instrumented
+    def approximate_betweenness_centrality(self, epsilon=0.05, delta=0.1, seed=None):
+        """
+        Estimates standardized betweenness centrality of every node by sampling
+        shortest paths, following Riondato and Kornaropoulos, "Fast approximation
+        of betweenness centrality through sampling" (2016).
+
+        Each sample picks an ordered pair of distinct nodes uniformly at random,
+        then one of their shortest paths uniformly at random, and credits the
+        inner nodes of the path. The number of samples depends on epsilon, delta
+        and a bound on the vertex diameter only, not on the size of the graph.
+
+        Args:
+            epsilon: Additive error allowed on the normalized betweenness
+            delta: Allowed probability of exceeding the error
+            seed: Seed of the random number generator, for reproducible estimates
+
+        Returns:
+            List of a list of floats and a float. The i-th float of the list is
+            the estimated standardized betweenness centrality of self.vertices[i].
+            With probability at least 1-delta, every estimate is within the
+            second element of the exact standardized betweenness centrality.
+        """
+        num_of_nodes=len(self.vertices)
+        rng=random.Random(seed)
+        #Bound on the number of nodes of a shortest path
+        vertex_diameter=2*_max_eccentricity(self._offsets, self._targets)+1
+        num_of_samples=math.ceil(0.5/epsilon**2*(math.floor(math.log2(max(vertex_diameter-2, 1)))+1+math.log(1/delta)))
+        counts=[0]*num_of_nodes
+        for _ in range(num_of_samples):
+            u=rng.randrange(num_of_nodes)
+            v=rng.randrange(num_of_nodes-1)
+            if v>=u:
+                v+=1
+            for w in _sample_shortest_path(self._offsets, self._targets, u, v, rng, self._stats):
+                counts[w]+=1
+        #Samples estimate betweenness normalized by the n(n-1) ordered pairs, standardized
+        #betweenness normalizes by the (n-1)(n-2) ordered pairs not containing the node
+        scale=num_of_nodes/((num_of_nodes-2)*num_of_samples)
+        return([[count*scale for count in counts], epsilon*num_of_nodes/(num_of_nodes-2)])
+
+    @_instrumented
+    def top_k_betweenness_centrality(self, workers=None, approx=False, epsilon=0.05, delta=0.1, seed=None, k=None):
         """
         Find top k nodes based on highest equal standardized betweenness centrality.
 
-        
+        Args:
+            workers: Number of processes to split BFS sources across,
+                None or 1 to compute in this process. A script using workers
+                must run them under if __name__ == "__main__":, see
+                all_betweenness_centrality.
+            approx: If True, rank nodes by the estimates of
+                approximate_betweenness_centrality instead of exact scores
+            epsilon: Error allowed on the estimates when approx is True
+            delta: Allowed probability of exceeding the error when approx is True
+            seed: Seed of the random number generator when approx is True
+            k: If given, find the k nodes of highest betweenness centrality
+                and the nodes tied with the k-th one instead. Unless the scores
+                are already known, approx is True or the work is split across
+                workers, the scores are computed by _leaf_brandes, which needs
+                no BFS from nodes of degree 1, and are kept like the ones of
+                all_betweenness_centrality.
+
         Returns:
-            List a integer, denoting top k nodes based on betweenness
-            centrality.
-        """
-        list_of_sbc=[]
-        for i in self.vertices:
-            list_of_sbc.append((self.betweenness_centrality(i), i))
-        #print("Before "+str(list_of_sbc))
-        list_of_sbc.sort(reverse=True)
-        #print("After "+str(list_of_sbc))
-        z=[[],0]
-        for i in range(len(list_of_sbc)):
-            if i==0:
-                z[0].append(list_of_sbc[i][1])
+            List of a list of integers and a float, denoting top k nodes based
+            on betweenness centrality and their standardized betweenness centrality.
+            With approx=True, nodes are ranked by the sampled estimates.
+            With k and approx=False, the nodes are in the order of
+            self.vertices, and the float is the score of the k-th node.
+        """
+        if k is not None and k<1:
+            raise Exception("k must be a positive integer, got {}".format(k))
+        if not self.vertices:
+            return([[], 0])
+        if k is not None and not approx:
+            if self._betweenness is None and (workers is None or workers<=1):
+                self._betweenness=_leaf_brandes(self._offsets, self._targets, self._stats)
+            scores=self.all_betweenness_centrality(workers)
+            score=heapq.nlargest(k, scores)[-1]
+            #Scores are sums of floats accumulated in different orders, so ties are compared with a tolerance
+            return([[node for node, sbc in zip(self.vertices, scores) if sbc>=score or _tied(sbc, score)], score])
+        if approx:
+            scores=self.approximate_betweenness_centrality(epsilon, delta, seed)[0]
+        else:
+            scores=self.all_betweenness_centrality(workers)
+        list_of_sbc=sorted(zip(scores, self.vertices), reverse=True)
+        z=[[], list_of_sbc[min(k or 1, len(list_of_sbc))-1][0]]
+        for sbc, node in list_of_sbc:
+            #Scores are sums of floats accumulated in different orders, so ties are compared with a tolerance
+            if sbc<z[1] and not _tied(sbc, z[1]):
+                break
+            z[0].append(node)
+        return(z)
+
+    @_instrumented
+    def centralities(self, metrics=None):
+        """
+        Computes several centralities of every node, or edge, in a single pass
+        of one BFS and one dependency accumulation per source, so that every
+        metric after the first only adds a constant amount of work per node
+        or edge visited
+
+        Args:
+            metrics: Iterable of metric names, None for all of them:
+                "betweenness": standardized betweenness centrality, as
+                    returned by all_betweenness_centrality, sharing its
+                    cached scores
+                "edge_betweenness": fraction of the ordered pairs of distinct
+                    nodes whose shortest paths go through an edge, on average
+                    over their shortest paths
+                "closeness": number of other nodes reachable from a node over
+                    the sum of their distances, scaled by the fraction of the
+                    other nodes that are reachable, 0 for isolated nodes
+                "harmonic": sum of the inverse distances to the other nodes
+                "stress": number of shortest paths between ordered pairs of
+                    other nodes through a node
+                "eccentricity": largest distance to a node reachable from a node
+
+        Returns:
+            Dictionary mapping every requested metric name to an array, of
+            integers for eccentricity and of doubles otherwise. The i-th entry
+            is the value of self.vertices[i], or of self.edges[i] for
+            edge_betweenness.
+        """
+        wanted=_METRICS if metrics is None else tuple(metrics)
+        for name in wanted:
+            if name not in _METRICS:
+                raise Exception("Unknown metric {}, expected one of {}".format(name, ", ".join(_METRICS)))
+        offsets=self._offsets
+        targets=self._targets
+        num_of_nodes=len(self.vertices)
+        edge_ids, num_of_edges=_edge_ids(offsets, targets) if "edge_betweenness" in wanted else (None, 0)
+        #Cached betweenness is reused, and betweenness computed here is cached, in the
+        #source blocks of all_betweenness_centrality so that both give the same sums
+        missing=tuple(name for name in wanted if name!="betweenness" or self._betweenness is None)
+        values={}
+        if missing:
+            values=_centralities(offsets, targets, _source_blocks(num_of_nodes), missing, edge_ids, num_of_edges, self._stats)
+        if "betweenness" in missing:
+            self._betweenness=values["betweenness"]
+        result={}
+        for name in wanted:
+            if name=="betweenness":
+                scale=(num_of_nodes-1)*(num_of_nodes-2)
+                result[name]=array('d', [bc/scale for bc in self._betweenness])
+            elif name=="edge_betweenness":
+                scale=num_of_nodes*(num_of_nodes-1)
+                result[name]=array('d', [bc/scale for bc in values[name]])
+            elif name=="closeness":
+                closeness=array('d', bytes(8*num_of_nodes))
+                for v, (reached, total) in enumerate(zip(values["reached"], values["total"])):
+                    if total:
+                        closeness[v]=(reached/total)*(reached/(num_of_nodes-1))
+                result[name]=closeness
             else:
-                if list_of_sbc[i][0]==list_of_sbc[i-1][0]:
-                    z[0].append(list_of_sbc[i][1])
+                result[name]=values[name]
+        return(result)
+
+
+def _align8(offset):
+    """
+    Rounds offset up to a multiple of 8
+    """
+    return(-(-offset//8)*8)
+
+
+def _parse_label(token):
+    """
+    Converts an edge list column to a vertex label: an integer for plain
+    integer literals, a string otherwise. Literals like 01, +1 or 1_0 stay
+    strings, so that they are not merged with another label.
+    """
+    if _INTEGER_LABEL.fullmatch(token):
+        return(int(token))
+    return(token.decode())
+
+
+def _read_chunks(path_or_file, use_mmap, chunk_size):
+    """
+    Reads a file as a sequence of byte strings of at most chunk_size bytes
+
+    Args:
+        path_or_file: Path of the file, or a file object opened for reading
+            in text or binary mode
+        use_mmap: If True and a path is given, slice the chunks out of a
+            read-only memory map of the file
+        chunk_size: Maximum number of bytes per chunk
+    """
+    if not isinstance(path_or_file, (str, bytes, os.PathLike)):
+        while True:
+            chunk=path_or_file.read(chunk_size)
+            if not chunk:
+                return
+            if isinstance(chunk, str):
+                chunk=chunk.encode()
+            yield(chunk)
+    with open(path_or_file, 'rb') as f:
+        if use_mmap and os.fstat(f.fileno()).st_size>0:
+            with _mmap.mmap(f.fileno(), 0, access=_mmap.ACCESS_READ) as mm:
+                for pos in range(0, len(mm), chunk_size):
+                    yield(mm[pos:pos+chunk_size])
+        else:
+            yield from _read_chunks(f, False, chunk_size)
+
+
+def _add(bc, partial):
+    """
+    Adds partial into bc elementwise
+    """
+    for i, x in enumerate(partial):
+        bc[i]+=x
+
+
+def _repair_dependencies(offsets, targets, sources, u, v, sign, bc, stats=None):
+    """
+    Repairs raw dependency sums after the edge (u, v) is added or removed,
+    in the spirit of Green et al., "A fast algorithm for streaming
+    betweenness centrality" (2012), but without keeping per source state
+
+    The adjacency must contain the edge. For a source s, the targets whose
+    shortest paths from s change are the endpoint farther from s and its
+    descendants in the shortest path DAG of s with the edge, the region R.
+    All other targets have the same shortest paths with or without the edge.
+    So a BFS with the edge, stopped below the deepest level of R, a search
+    restricted to R without it, and two dependency accumulations restricted
+    to the targets in R, which only visit R and its ancestors, give the
+    change of the dependencies of s. As the shortest paths between s and t
+    are the same both ways, this also gives the change for the pairs (t, s),
+    so only the sources on one side of the edge are needed, see _edge_side.
+
+    Args:
+        offsets: CSR row offsets of the graph with the edge
+        targets: CSR neighbour indices of the graph with the edge
+        sources: Node indices closer to the same endpoint of the edge
+        u: One endpoint of the edge
+        v: The other endpoint of the edge
+        sign: 1 if the edge was added, -1 if it is being removed
+        bc: array of doubles of raw dependency sums, updated in place
+        stats: GraphStats to record every BFS in, if not None
+    """
+    num_of_nodes=len(offsets)-1
+    for s in sources:
+        dist=[-1]*num_of_nodes
+        sigma=[0]*num_of_nodes
+        dist[s]=0
+        sigma[s]=1
+        level=[s]
+        expanded=0
+        #Children of a node of the region are one level below it, and in the region
+        region=set()
+        while level:
+            if region and region.isdisjoint(level):
+                #The region ended on the level above, whose neighbours are all known
+                break
+            below=[]
+            for x in level:
+                expanded+=offsets[x+1]-offsets[x]
+                d=dist[x]+1
+                in_region=x in region
+                for w in targets[offsets[x]:offsets[x+1]]:
+                    if dist[w]<0:
+                        dist[w]=d
+                        below.append(w)
+                    if dist[w]==d:
+                        sigma[w]+=sigma[x]
+                        if in_region or (x==u and w==v) or (x==v and w==u):
+                            region.add(w)
+            level=below
+        if stats is not None:
+            stats.record_bfs(sum(1 for d in dist if d>=0), expanded)
+        if not region:
+            continue
+        _add_region_dependencies(offsets, targets, dist, sigma, region, s, 2*sign, bc)
+        #Distances and path counts of the region without the edge, the rest of the graph keeping its own
+        dist, sigma=_region_without_edge(offsets, targets, dist, sigma, region, u, v)
+        _add_region_dependencies(offsets, targets, dist, sigma, region, s, -2*sign, bc, (u, v))
+
+
+def _edge_side(row_u, row_v):
+    """
+    Finds the sources whose shortest path DAG can contain the edge (u, v),
+    given the distances from u and v, which are the distances to u and v
+
+    A pair of nodes whose shortest paths use the edge has one node closer
+    to u and the other closer to v, so the smaller of the two sides is
+    enough to repair all of them.
+
+    Returns:
+        List of the nodes closer to u, or of the nodes closer to v if there
+        are fewer of them
+    """
+    closer_u=[]
+    closer_v=[]
+    for s, (du, dv) in enumerate(zip(row_u, row_v)):
+        if du>=0 and (dv<0 or du<dv):
+            closer_u.append(s)
+        elif dv>=0 and (du<0 or dv<du):
+            closer_v.append(s)
+    return(closer_u if len(closer_u)<=len(closer_v) else closer_v)
+
+
+def _region_without_edge(offsets, targets, dist, sigma, region, u, v):
+    """
+    Recomputes the distances and shortest path counts of the nodes of a
+    region when the edge (u, v) is left out, the nodes outside the region
+    keeping theirs
+
+    Returns:
+        Copies of dist and sigma with the entries of the region replaced,
+        -1 and 0 for the nodes of the region no longer reachable
+    """
+    dist=list(dist)
+    sigma=list(sigma)
+    for x in region:
+        dist[x]=-1
+        sigma[x]=0
+    #Nodes of the region by tentative distance, starting from their neighbours outside of it
+    buckets={}
+    for x in region:
+        best=-1
+        for w in targets[offsets[x]:offsets[x+1]]:
+            if w not in region and dist[w]>=0 and (best<0 or dist[w]+1<best) and not _is_edge(x, w, u, v):
+                best=dist[w]+1
+        if best>0:
+            buckets.setdefault(best, []).append(x)
+    reached=[]
+    level=min(buckets, default=0)
+    while buckets:
+        for x in buckets.pop(level, []):
+            if dist[x]>=0:
+                continue
+            dist[x]=level
+            reached.append(x)
+            for w in targets[offsets[x]:offsets[x+1]]:
+                if w in region and dist[w]<0 and not _is_edge(x, w, u, v):
+                    buckets.setdefault(level+1, []).append(w)
+        level+=1
+    #reached is ordered by distance, so predecessors in the region are counted first
+    for x in reached:
+        d=dist[x]-1
+        sigma[x]=sum(sigma[w] for w in targets[offsets[x]:offsets[x+1]] if dist[w]==d and not _is_edge(x, w, u, v))
+    return(dist, sigma)
+
+
+def _add_region_dependencies(offsets, targets, dist, sigma, region, source, weight, bc, skip=None):
+    """
+    Adds the dependencies of source on every node, counting only the targets
+    in region, multiplied by weight, to bc. Only the region and its ancestors
+    in the shortest path DAG of source are visited.
+
+    Args:
+        dist: Distances from source to every node
+        sigma: Shortest path counts from source to every node
+        skip: Edge (u, v) to leave out of the graph, or None
+    """
+    buckets={}
+    for x in region:
+        if dist[x]>0:
+            buckets.setdefault(dist[x], set()).add(x)
+    delta={}
+    level=max(buckets, default=0)
+    while level>0:
+        for x in buckets.pop(level, ()):
+            dependency=delta.get(x, 0.0)
+            coeff=((x in region)+dependency)/sigma[x]
+            for w in targets[offsets[x]:offsets[x+1]]:
+                if dist[w]==level-1 and not (skip is not None and _is_edge(x, w, skip[0], skip[1])):
+                    delta[w]=delta.get(w, 0.0)+sigma[w]*coeff
+                    buckets.setdefault(level-1, set()).add(w)
+            bc[x]+=weight*dependency
+        level-=1
+
+
+def _is_edge(x, w, u, v):
+    """
+    Checks if (x, w) is the undirected edge (u, v)
+    """
+    return((x==u and w==v) or (x==v and w==u))
+
+
+def _tied(a, b):
+    """
+    Checks if two betweenness scores are equal up to floating point round-off
+    """
+    return(math.isclose(a, b, rel_tol=1e-9, abs_tol=1e-12))
+
+
+def _bfs(offsets, targets, source):
+    """
+    Iterative BFS over a CSR adjacency
+
+    Args:
+        offsets: CSR row offsets of the graph
+        targets: CSR neighbour indices of the graph
+        source: Index of the node to start from
+
+    Returns:
+        array of ints, where the i-th entry is the distance from source to
+        node i, or -1 if node i cannot be reached
+    """
+    dist=array('i', [-1])*(len(offsets)-1)
+    dist[source]=0
+    frontier=[source]
+    d=0
+    while frontier:
+        d+=1
+        next_frontier=[]
+        for v in frontier:
+            for w in targets[offsets[v]:offsets[v+1]]:
+                if dist[w]<0:
+                    dist[w]=d
+                    next_frontier.append(w)
+        frontier=next_frontier
+    return(dist)
+
+
+def _multi_source_bfs(offsets, targets, sources):
+    """
+    Bit-parallel BFS from several sources over a CSR adjacency
+
+    Bit b of the masks below stands for sources[b]. Every level, the
+    frontier masks are pushed to the neighbours with one integer OR per
+    edge, and the bits a vertex has not seen yet form its new frontier.
+
+    Args:
+        offsets: CSR row offsets of the graph
+        targets: CSR neighbour indices of the graph
+        sources: List of distinct node indices to start from
+
+    Returns:
+        List of array('i') distance rows, one per source, with -1 for nodes
+        that cannot be reached
+    """
+    num_of_nodes=len(offsets)-1
+    rows=[array('i', [-1])*num_of_nodes for _ in sources]
+    seen=[0]*num_of_nodes
+    frontier={}
+    for b, s in enumerate(sources):
+        rows[b][s]=0
+        seen[s]|=1<<b
+        frontier[s]=frontier.get(s, 0)|(1<<b)
+    d=0
+    while frontier:
+        d+=1
+        reached={}
+        for v, mask in frontier.items():
+            for w in targets[offsets[v]:offsets[v+1]]:
+                reached[w]=reached.get(w, 0)|mask
+        frontier={}
+        for w, mask in reached.items():
+            new=mask&~seen[w]
+            if new:
+                seen[w]|=new
+                frontier[w]=new
+                while new:
+                    low=new&-new
+                    rows[low.bit_length()-1][w]=d
+                    new^=low
+    return(rows)
+
+
+def _brandes(offsets, targets, sources, stats=None, weights=None):
+    """
+    Accumulates Brandes dependencies over the given BFS sources, as the
+    betweenness only case of _centralities
+
+    Args:
+        offsets: CSR row offsets of the graph
+        targets: CSR neighbour indices of the graph
+        sources: Iterable of node indices to run a BFS from
+        stats: GraphStats to record every BFS in, if not None
+        weights: If not None, list of the number of nodes every node stands
+            for, as a source and as a target
+
+    Returns:
+        array of doubles, where the i-th entry is the sum over all sources s
+        of the dependency of s on node i
+    """
+    return(_centralities(offsets, targets, [sources], ("betweenness",), stats=stats, weights=weights, factors=weights)["betweenness"])
+
+
+def _components(offsets, targets):
+    """
+    Labels the connected components of the graph
+
+    Returns:
+        List of integers, where the i-th entry is the smallest node index in
+        the component of node i
+    """
+    num_of_nodes=len(offsets)-1
+    component=[-1]*num_of_nodes
+    for start in range(num_of_nodes):
+        if component[start]>=0:
+            continue
+        component[start]=start
+        frontier=[start]
+        for v in frontier:
+            for w in targets[offsets[v]:offsets[v+1]]:
+                if component[w]<0:
+                    component[w]=start
+                    frontier.append(w)
+    return(component)
+
+
+def _biconnected(offsets, targets):
+    """
+    Splits every connected component into biconnected blocks, with an
+    iterative Hopcroft-Tarjan DFS
+
+    Returns:
+        List of pairs of a list of node indices and a list of weights, one
+        pair per block. The weight of a node in a block is the number of nodes
+        of its component that reach the block through it, itself included, so
+        the weights of a block sum to the size of its component.
+    """
+    num_of_nodes=len(offsets)-1
+    disc=[-1]*num_of_nodes
+    low=[0]*num_of_nodes
+    parent=[-1]*num_of_nodes
+    size=[1]*num_of_nodes
+    #Number of nodes below a node in the DFS tree that are cut off by removing it
+    cut=[0]*num_of_nodes
+    blocks=[]
+    clock=0
+    for root in range(num_of_nodes):
+        if disc[root]>=0:
+            continue
+        disc[root]=low[root]=clock
+        clock+=1
+        stack=[[root, offsets[root]]]
+        visited=[root]
+        found=[]
+        while stack:
+            top=stack[-1]
+            v=top[0]
+            if top[1]<offsets[v+1]:
+                w=targets[top[1]]
+                top[1]+=1
+                if disc[w]<0:
+                    parent[w]=v
+                    disc[w]=low[w]=clock
+                    clock+=1
+                    visited.append(w)
+                    stack.append([w, offsets[w]])
+                elif w!=parent[v] and disc[w]<low[v]:
+                    low[v]=disc[w]
+                continue
+            stack.pop()
+            if not stack:
+                break
+            p=parent[v]
+            size[p]+=size[v]
+            if low[v]<low[p]:
+                low[p]=low[v]
+            if low[v]>=disc[p]:
+                #p separates the DFS subtree of v, whose nodes on the stack form a block with p
+                cut[p]+=size[v]
+                nodes=[]
+                while nodes[-1:]!=[v]:
+                    nodes.append(visited.pop())
+                found.append((p, v, nodes))
+        total=size[root]
+        for p, v, nodes in found:
+            blocks.append((nodes+[p], [1+cut[u] for u in nodes]+[total-size[v]]))
+    return(blocks)
+
+
+def _block_brandes(offsets, targets, stats=None):
+    """
+    Computes raw Brandes dependency sums block by block, following Puzis et
+    al., "Heuristics for speeding up betweenness centrality computation" (2012)
+
+    A shortest path through a block enters and leaves it through the nodes
+    its endpoints reach the block through, so weighted Brandes passes inside
+    every block, with the weights of _biconnected, count every pair whose
+    path crosses the block. An articulation point is also on every path
+    between two nodes it separates, which adds (N-1)^2 minus the sum over its
+    blocks of (N-w)^2, N being the size of its component and w its weight.
+
+    Returns:
+        array of doubles, where the i-th entry is the sum over all ordered
+        pairs of nodes of the fraction of their shortest paths through node i
+    """
+    num_of_nodes=len(offsets)-1
+    bc=array('d', bytes(8*num_of_nodes))
+    total=[0]*num_of_nodes
+    separated=[0]*num_of_nodes
+    for nodes, weights in _biconnected(offsets, targets):
+        component=sum(weights)
+        for u, weight in zip(nodes, weights):
+            total[u]=component
+            separated[u]+=(component-weight)**2
+        #Blocks of two nodes have no inner node
+        if len(nodes)<3:
+            continue
+        local={u: i for i, u in enumerate(nodes)}
+        block_offsets=array('i', [0])
+        block_targets=array('i')
+        for u in nodes:
+            block_targets.extend(local[w] for w in targets[offsets[u]:offsets[u+1]] if w in local)
+            block_offsets.append(len(block_targets))
+        partial=_brandes(block_offsets, block_targets, range(len(nodes)), stats, weights)
+        for u, dependency in zip(nodes, partial):
+            bc[u]+=dependency
+    for u in range(num_of_nodes):
+        if total[u]:
+            bc[u]+=(total[u]-1)**2-separated[u]
+    return(bc)
+
+
+def _leaf_brandes(offsets, targets, stats=None):
+    """
+    Computes raw Brandes dependency sums without running a BFS from nodes of
+    degree 1
+
+    A leaf is inside no shortest path, and the shortest paths from a leaf l
+    are the ones from its neighbour s with l in front, so the dependency of
+    l on every other node than s is the one of s. The BFS from s is counted
+    once for s and once for each of its leaves, and s is on the paths from
+    each of its leaves to the other nodes of its component, which trees and
+    other graphs with many leaves compute with far fewer BFS runs than nodes.
+
+    Returns:
+        array of doubles, where the i-th entry is the sum over all ordered
+        pairs of nodes of the fraction of their shortest paths through node i
+    """
+    num_of_nodes=len(offsets)-1
+    degree=[offsets[v+1]-offsets[v] for v in range(num_of_nodes)]
+    leaves=[0]*num_of_nodes
+    sources=[]
+    for v in range(num_of_nodes):
+        #The ends of an isolated edge are both leaves, one of them is run
+        if degree[v]==1 and (degree[targets[offsets[v]]]>1 or targets[offsets[v]]<v):
+            leaves[targets[offsets[v]]]+=1
+        else:
+            sources.append(v)
+    factors=[1+count for count in leaves]
+    bc=_centralities(offsets, targets, [sources], ("betweenness",), stats=stats, factors=factors)["betweenness"]
+    component=_components(offsets, targets)
+    size=Counter(component)
+    for v in sources:
+        if leaves[v]:
+            bc[v]+=leaves[v]*(size[component[v]]-2)
+    return(bc)
+
+
+def _edge_ids(offsets, targets):
+    """
+    Numbers the edges in the order of Graph.edges
+
+    Returns:
+        array of integers, where the i-th entry is the number of the edge of
+        the CSR entry targets[i], and the number of edges
+    """
+    edge_ids=array('i', bytes(4*len(targets)))
+    count=0
+    for v in range(len(offsets)-1):
+        for i in range(offsets[v], offsets[v+1]):
+            w=targets[i]
+            if w>=v:
+                edge_ids[i]=count
+                count+=1
+            else:
+                edge_ids[i]=edge_ids[bisect.bisect_left(targets, v, offsets[w], offsets[w+1])]
+    return(edge_ids, count)
+
+
+def _centralities(offsets, targets, blocks, wanted, edge_ids=None, num_of_edges=0, stats=None, weights=None, factors=None):
+    """
+    Runs one BFS and one dependency accumulation per source, filling every
+    wanted metric of Graph.centralities on the way. This is the Brandes pass
+    of every exact betweenness computation, _brandes being its betweenness
+    only case.
+
+    Args:
+        offsets: CSR row offsets of the graph
+        targets: CSR neighbour indices of the graph
+        blocks: Iterable of iterables of node indices to run a BFS from.
+            Betweenness is summed per block and the block sums are added in
+            order, like _reduce_partials does.
+        wanted: Metric names of Graph.centralities to fill
+        edge_ids: Edge number of every CSR entry, from _edge_ids, if
+            edge_betweenness is wanted
+        num_of_edges: Number of edges, if edge_betweenness is wanted
+        stats: GraphStats to record every BFS in, if not None
+        weights: If not None, weight of every node as a target of the
+            dependencies, read when a source is run, 1 otherwise
+        factors: If not None, factor of the dependencies of every source on
+            the betweenness, 1 otherwise
+
+    Returns:
+        Dictionary of the raw sums of the wanted metrics over the sources,
+        with closeness as "reached", the number of other nodes reached from
+        every source, and "total", the sum of their distances
+    """
+    num_of_nodes=len(offsets)-1
+    node_bc=array('d', bytes(8*num_of_nodes)) if "betweenness" in wanted else None
+    edge_bc=array('d', bytes(8*num_of_edges)) if "edge_betweenness" in wanted else None
+    stress=[0]*num_of_nodes if "stress" in wanted else None
+    harmonic=array('d', bytes(8*num_of_nodes)) if "harmonic" in wanted else None
+    eccentricity=array('i', bytes(4*num_of_nodes)) if "eccentricity" in wanted else None
+    reached=array('i', bytes(4*num_of_nodes)) if "closeness" in wanted else None
+    total=array('q', bytes(8*num_of_nodes)) if "closeness" in wanted else None
+    accumulate=node_bc is not None or edge_bc is not None or stress is not None
+    #Without edges or paths to count, the accumulation only walks the DAG for betweenness
+    plain=edge_bc is None and stress is None
+    for block in blocks:
+        partial=array('d', bytes(8*num_of_nodes)) if node_bc is not None else None
+        for s in block:
+            dist=[-1]*num_of_nodes
+            sigma=[0]*num_of_nodes
+            dist[s]=0
+            sigma[s]=1
+            order=[s]
+            #BFS, counting shortest paths from s to every node
+            for v in order:
+                d=dist[v]+1
+                for w in targets[offsets[v]:offsets[v+1]]:
+                    if dist[w]<0:
+                        dist[w]=d
+                        order.append(w)
+                    if dist[w]==d:
+                        sigma[w]+=sigma[v]
+            if stats is not None:
+                stats.record_bfs(len(order), sum(offsets[v+1]-offsets[v] for v in order))
+            if eccentricity is not None:
+                eccentricity[s]=dist[order[-1]]
+            if reached is not None:
+                reached[s]=len(order)-1
+                total[s]=sum(dist[v] for v in order)
+            if harmonic is not None:
+                harmonic[s]=math.fsum(1/dist[v] for v in order[1:])
+            if not accumulate:
+                continue
+            #Dependency accumulation in order of non-increasing distance from s,
+            #delta counts the dependency on a node, paths the shortest paths leaving it down the DAG
+            delta=[0.0]*num_of_nodes
+            if plain and weights is None:
+                #Unweighted betweenness only, as for all_betweenness_centrality
+                for w in reversed(order):
+                    d=dist[w]-1
+                    coeff=(1+delta[w])/sigma[w]
+                    for v in targets[offsets[w]:offsets[w+1]]:
+                        if dist[v]==d:
+                            delta[v]+=sigma[v]*coeff
+            elif plain:
+                for w in reversed(order):
+                    d=dist[w]-1
+                    coeff=(weights[w]+delta[w])/sigma[w]
+                    for v in targets[offsets[w]:offsets[w+1]]:
+                        if dist[v]==d:
+                            delta[v]+=sigma[v]*coeff
+            else:
+                paths=[0]*num_of_nodes
+                for w in reversed(order):
+                    d=dist[w]-1
+                    coeff=((1 if weights is None else weights[w])+delta[w])/sigma[w]
+                    for i in range(offsets[w], offsets[w+1]):
+                        v=targets[i]
+                        if dist[v]==d:
+                            share=sigma[v]*coeff
+                            delta[v]+=share
+                            paths[v]+=1+paths[w]
+                            if edge_bc is not None:
+                                edge_bc[edge_ids[i]]+=share
+                    if stress is not None and w!=s:
+                        stress[w]+=sigma[w]*paths[w]
+            if partial is not None:
+                #order starts with s, whose dependency on itself is not counted
+                if factors is None:
+                    for w in order[1:]:
+                        partial[w]+=delta[w]
                 else:
-                    z[1]=list_of_sbc[0][0]
+                    factor=factors[s]
+                    for w in order[1:]:
+                        partial[w]+=factor*delta[w]
+        if partial is not None:
+            _add(node_bc, partial)
+    values={"reached": reached, "total": total, "harmonic": harmonic, "eccentricity": eccentricity}
+    values["betweenness"]=node_bc
+    values["edge_betweenness"]=edge_bc
+    if stress is not None:
+        values["stress"]=array('d', stress)
+    return(values)
+
+
+def _max_eccentricity(offsets, targets):
+    """
+    Finds the largest eccentricity of one arbitrary node per connected
+    component, which is at least half the diameter of the graph
+
+    Returns:
+        An integer, the number of BFS levels below the start node of the
+        deepest search
+    """
+    num_of_nodes=len(offsets)-1
+    seen=bytearray(num_of_nodes)
+    deepest=0
+    for start in range(num_of_nodes):
+        if seen[start]:
+            continue
+        seen[start]=1
+        frontier=[start]
+        depth=-1
+        while frontier:
+            depth+=1
+            next_frontier=[]
+            for v in frontier:
+                for w in targets[offsets[v]:offsets[v+1]]:
+                    if not seen[w]:
+                        seen[w]=1
+                        next_frontier.append(w)
+            frontier=next_frontier
+        deepest=max(deepest, depth)
+    return(deepest)
+
+
+def _sample_shortest_path(offsets, targets, u, v, rng, stats=None):
+    """
+    Samples one of the shortest paths between u and v uniformly at random
+
+    The BFS from u stops at the level of v, and keeps its state in
+    dictionaries so that a sample only costs the part of the graph explored.
+    If stats is not None, the BFS is recorded in it.
+
+    Returns:
+        List of the inner node indices of the path, empty if v cannot be
+        reached or is a neighbour of u
+    """
+    dist={u: 0}
+    sigma={u: 1}
+    frontier=[u]
+    while frontier and v not in dist:
+        next_frontier=[]
+        for x in frontier:
+            d=dist[x]+1
+            for w in targets[offsets[x]:offsets[x+1]]:
+                if w not in dist:
+                    dist[w]=d
+                    sigma[w]=0
+                    next_frontier.append(w)
+                if dist[w]==d:
+                    sigma[w]+=sigma[x]
+        frontier=next_frontier
+    if stats is not None:
+        stats.record_bfs(len(dist), sum(offsets[x+1]-offsets[x] for x in dist))
+    inner=[]
+    if v not in dist:
+        return(inner)
+    #Walk back to u, picking each predecessor with probability proportional to its path count
+    w=v
+    while dist[w]>1:
+        d=dist[w]-1
+        pick=rng.randrange(sigma[w])
+        for p in targets[offsets[w]:offsets[w+1]]:
+            if dist.get(p)==d:
+                pick-=sigma[p]
+                if pick<0:
                     break
-        return(z)
+        inner.append(p)
+        w=p
+    return(inner)
+
+
+def _source_blocks(num_of_nodes):
+    """
+    Splits the BFS sources 0..num_of_nodes-1 into at most _MAX_SOURCE_BLOCKS
+    contiguous blocks, independently of the number of workers
+    """
+    size=max(1, -(-num_of_nodes//_MAX_SOURCE_BLOCKS))
+    return([range(lo, min(lo+size, num_of_nodes)) for lo in range(0, num_of_nodes, size)])
+
+
+def _reduce_partials(num_of_nodes, partials):
+    """
+    Sums per block dependency vectors, in the order they are given
+    """
+    bc=array('d', bytes(8*num_of_nodes))
+    for partial in partials:
+        _add(bc, partial)
+    return(bc)
+
+
+def _parallel_brandes(offsets, targets, blocks, workers):
+    """
+    Runs _brandes for every block of sources in a process pool, started
+    from the context of _pool_context
+
+    The CSR arrays are copied once into shared memory segments which the
+    workers attach to, instead of being pickled to every worker.
+
+    Returns:
+        array of doubles, the reduction of the block partials in block order
+    """
+    segments=[]
+    try:
+        for arr in (offsets, targets):
+            segment=shared_memory.SharedMemory(create=True, size=max(1, arr.itemsize*len(arr)))
+            segment.buf[:arr.itemsize*len(arr)]=arr.tobytes()
+            segments.append(segment)
+        spec=[(segment.name, len(arr)) for segment, arr in zip(segments, (offsets, targets))]
+        with _pool_context().Pool(workers, initializer=_attach_shared_graph, initargs=(spec,)) as pool:
+            #imap hands the partials back in block order, keeping the reduction deterministic
+            partials=pool.imap(_brandes_shared, blocks)
+            return(_reduce_partials(len(offsets)-1, partials))
+    finally:
+        for segment in segments:
+            segment.close()
+            segment.unlink()
+
+
+def _pool_context():
+    """
+    Multiprocessing context of the worker pools, forkserver where available
+    and spawn otherwise. Forking the calling process itself could copy locks
+    held by its other threads, e.g. the executor thread of QueryServer, into
+    the workers.
+    """
+    methods=multiprocessing.get_all_start_methods()
+    return(multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn"))
+
+
+#CSR arrays of the graph attached by a pool worker, see _attach_shared_graph
+_shared_graph=None
+
+
+def _attach_shared_graph(spec):
+    """
+    Pool initializer attaching the shared memory CSR arrays of the graph
+    """
+    global _shared_graph
+    segments=[]
+    views=[]
+    for name, length in spec:
+        #Workers share the resource tracker of the parent, which owns and
+        #unlinks the segment
+        segment=shared_memory.SharedMemory(name=name)
+        segments.append(segment)
+        views.append(segment.buf.cast('i')[:length])
+    _shared_graph=(segments, views[0], views[1])
+
+
+def _brandes_shared(sources):
+    """
+    Pool task running _brandes on the attached shared memory graph
+    """
+    _, offsets, targets=_shared_graph
+    return(_brandes(offsets, targets, sources))
+
+
+class QueryServer(object):
+    def __init__(self, graph, workers=None):
+        """
+        Answers JSON queries on one warm graph, keeping its distance cache and
+        betweenness between queries
+
+        Queries are computed one at a time in a background thread, as the
+        graph and its caches are not thread safe, while the event loop keeps
+        reading requests and writing answers. Identical queries arriving while
+        one is computed share its answer.
+
+        Args:
+            graph: Graph to answer queries on
+            workers: Number of processes betweenness queries split BFS
+                sources across, None or 1 to compute in the background thread.
+                The processes are not forked from the server, whose threads
+                could hold locks at the time, see _pool_context.
+        """
+        self.graph=graph
+        self.workers=workers
+        self._executor=ThreadPoolExecutor(max_workers=1)
+        #Futures of the queries being computed, by query without its id
+        self._inflight={}
+
+    def close(self):
+        self._executor.shutdown()
+
+    def _answer(self, query):
+        """
+        Computes the result of a query, see handle
+        """
+        graph=self.graph
+        kind=query.get("query")
+        if kind=="min_dist":
+            return(graph.min_dist(query["start"], query["end"]))
+        if kind=="shortest_paths":
+            return(graph.all_shortest_paths(query["start"], query["end"]))
+        if kind=="betweenness":
+            if "node" in query:
+                return(graph.betweenness_centrality(query["node"], self.workers))
+            return([list(pair) for pair in zip(graph.vertices, graph.all_betweenness_centrality(self.workers))])
+        if kind=="top_k":
+            return(graph.top_k_betweenness_centrality(self.workers, k=query.get("k")))
+        raise Exception("Unknown query {!r}, expected min_dist, shortest_paths, betweenness or top_k".format(kind))
+
+    async def handle(self, line):
+        """
+        Answers one line of JSON
+
+        Args:
+            line: JSON object with a "query" key and the arguments of the query:
+                {"query": "min_dist", "start": u, "end": v}
+                {"query": "shortest_paths", "start": u, "end": v}
+                {"query": "betweenness", "node": u}, or without node for all nodes
+                {"query": "top_k", "k": k}, or without k for the nodes tied first
+                An optional "id" key is copied to the answer.
+
+        Returns:
+            JSON object, without newline, with the id of the query and either
+            a "result" or an "error" key
+        """
+        try:
+            query=json.loads(line)
+            if not isinstance(query, dict):
+                raise Exception("Queries must be JSON objects")
+        except Exception as e:
+            return(json.dumps({"id": None, "error": str(e)}))
+        answer={"id": query.get("id")}
+        key=json.dumps({name: value for name, value in query.items() if name!="id"}, sort_keys=True)
+        future=self._inflight.get(key)
+        if future is None:
+            future=asyncio.get_running_loop().run_in_executor(self._executor, self._answer, query)
+            self._inflight[key]=future
+            future.add_done_callback(lambda _: self._inflight.pop(key, None))
+        try:
+            answer["result"]=await asyncio.shield(future)
+        except KeyError as e:
+            answer["error"]="Unknown node or missing argument {}".format(e)
+        except Exception as e:
+            answer["error"]=str(e)
+        return(json.dumps(answer))
+
+    async def serve_stdin(self, stdin=None, stdout=None):
+        """
+        Answers the lines of stdin on stdout, in the order the answers are
+        ready, until the end of stdin
+        """
+        stdin=stdin or sys.stdin
+        stdout=stdout or sys.stdout
+        loop=asyncio.get_running_loop()
+        pending=set()
+
+        async def respond(line):
+            stdout.write(await self.handle(line)+"\n")
+            stdout.flush()
+
+        #Reads block, so they get a thread of their own
+        with ThreadPoolExecutor(max_workers=1) as reader:
+            while True:
+                line=await loop.run_in_executor(reader, stdin.readline)
+                if not line:
+                    break
+                if line.strip():
+                    task=asyncio.ensure_future(respond(line))
+                    pending.add(task)
+                    task.add_done_callback(pending.discard)
+        if pending:
+            await asyncio.wait(pending)
+
+    async def serve_socket(self, path):
+        """
+        Answers the lines sent by every client of a unix socket at path,
+        until cancelled or terminated by SIGTERM
+        """
+        async def client(reader, writer):
+            tasks=set()
+
+            async def respond(line):
+                writer.write((await self.handle(line)+"\n").encode())
+                await writer.drain()
+
+            try:
+                while True:
+                    line=await reader.readline()
+                    if not line:
+                        break
+                    if line.strip():
+                        task=asyncio.ensure_future(respond(line))
+                        tasks.add(task)
+                        task.add_done_callback(tasks.discard)
+                if tasks:
+                    await asyncio.wait(tasks)
+            finally:
+                writer.close()
+
+        server=await asyncio.start_unix_server(client, path)
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            if os.path.exists(path):
+                os.unlink(path)
+
+
+def open_graph(path, delimiter=None):
+    """
+    Opens a graph file written by Graph.save, or else an edge list file
+
+    Returns:
+        The Graph in the file
+    """
+    with open(path, 'rb') as f:
+        magic=f.read(len(_FILE_MAGIC))
+    if magic==_FILE_MAGIC:
+        return(Graph.load(path))
+    return(Graph.from_edgelist(path, delimiter))
+
+
+def main(argv=None):
+    parser=argparse.ArgumentParser(prog="python3 -m nodemetrics")
+    commands=parser.add_subparsers(dest="command", required=True)
+    serve=commands.add_parser("serve", help="Answer JSON line queries on a graph kept in memory")
+    serve.add_argument("--graph", required=True, help="Graph file written by Graph.save, or edge list file")
+    serve.add_argument("--delimiter", help="Column separator of an edge list, whitespace and commas by default")
+    serve.add_argument("--socket", help="Listen on this unix socket instead of reading stdin")
+    serve.add_argument("--workers", type=int, help="Processes to compute betweenness with")
+    args=parser.parse_args(argv)
+
+    server=QueryServer(open_graph(args.graph, args.delimiter), args.workers)
+    try:
+        if args.socket:
+            asyncio.run(server.serve_socket(args.socket))
+        else:
+            asyncio.run(server.serve_stdin())
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        pass
+    finally:
+        server.close()
+    return(0)
+
+
 if __name__ == "__main__":
+    if len(sys.argv)>1:
+        sys.exit(main())
     vertices = [1, 2, 3, 4, 5, 6]
     edges    = [(1, 2), (1, 5), (2, 3), (2, 5), (3, 4), (4, 5), (4, 6), (3,6)]
 
@@ -1,5 +1,14 @@
-from nodemetrics import Graph
+from nodemetrics import Graph, QueryServer
 import unittest
+import itertools
+import math
+import io
+import json
+import os
+import tempfile
+import asyncio
+import subprocess
+import sys
 class testpoint(unittest.TestCase):
     def test_top_k_betweenness_centrality(self):
         a=Graph( [0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13] , [(0, 5), (1, 2), (2, 7), (3, 13), (0, 4), (5, 9), (6, 8), (4, 7), (1, 8), (8, 9), (10, 13), (6, 11), (3, 12), (6, 13)] )
@@ -119,5 +128,407 @@ class testpoint(unittest.TestCase):
         a=Graph( [0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15, 16, 17, 18] , [(0, 4), (1, 8), (2, 3), (3, 5), (4, 17), (5, 13), (1, 6), (2, 7), (8, 18), (8, 9), (7, 10), (11, 12), (9, 12), (3, 13), (2, 14), (15, 16), (10, 16), (3, 17), (17, 18)] )
         self.assertAlmostEqual(a.top_k_betweenness_centrality()[1], 0.6209150326797386 ,delta=0.00001 )
 
+    def test_betweenness_centrality(self):
+        a=Graph( [1, 2, 3, 4, 5, 6] , [(1, 2), (1, 5), (2, 3), (2, 5), (3, 4), (4, 5), (4, 6), (3, 6)] )
+        expected=[0.0, 0.2, 0.2, 0.2, 0.2, 0.0]
+        for node, sbc in zip(a.vertices, expected):
+            self.assertAlmostEqual(a.betweenness_centrality(node), sbc ,delta=0.00001 )
+        a=Graph( [0, 1, 2, 3, 4] , [(0, 1), (0, 2), (0, 3), (0, 4)] )
+        self.assertAlmostEqual(a.betweenness_centrality(0), 1.0 ,delta=0.00001 )
+        self.assertAlmostEqual(a.betweenness_centrality(3), 0.0 ,delta=0.00001 )
+        a=Graph( [0, 1, 2, 3] , [(0, 1), (1, 2), (2, 3), (0, 3)] )
+        self.assertEqual(sorted(a.top_k_betweenness_centrality()[0]), [0, 1, 2, 3])
+        self.assertAlmostEqual(a.top_k_betweenness_centrality()[1], 1/6 ,delta=0.00001 )
+
+    def test_adjacency(self):
+        a=Graph( [1, 2, 3, 4, 5, 6] , [(1, 2), (1, 5), (2, 3), (2, 5), (3, 4), (4, 5), (4, 6), (6, 3)] )
+        self.assertEqual(sorted(a.neighbours(4)), [3, 5, 6])
+        self.assertEqual(a.neighbours(1), [2, 5])
+        self.assertTrue(a.has_edge(3, 6))
+        self.assertTrue(a.has_edge(6, 3))
+        self.assertFalse(a.has_edge(1, 6))
+        self.assertFalse(a.has_edge(1, 7))
+        self.assertEqual(a.min_dist(1, 6), 3)
+        self.assertEqual(sorted(a.all_shortest_paths(1, 6)), [[1, 2, 3, 6], [1, 5, 4, 6]])
+
+    def test_min_dist(self):
+        n=5000
+        a=Graph( list(range(n)) , [(i, i+1) for i in range(n-1)] )
+        self.assertEqual(a.min_dist(0, n-1), n-1)
+        self.assertEqual(a.min_dist(n-1, 0), n-1)
+        self.assertEqual(a.min_dist(7, 7), 0)
+        a=Graph( [0, 1, 2, 3] , [(0, 1), (2, 3)] )
+        self.assertIsNone(a.min_dist(0, 3))
+        self.assertIsNone(a.all_shortest_paths(0, 3))
+
+    def test_distance_cache(self):
+        a=Graph( list(range(10)) , [(i, i+1) for i in range(9)] , cache_rows=2 )
+        a.min_dist(0, 9)
+        a.min_dist(0, 5)
+        a.min_dist(1, 9)
+        a.min_dist(2, 9)
+        stats=a.dist_cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["evictions"], stats["rows"]), (1, 3, 1, 2))
+        self.assertNotIn(0, a.dist_cache)
+        a=Graph( list(range(10)) , [(i, i+1) for i in range(9)] , cache_bytes=100 )
+        for i in range(10):
+            self.assertEqual(a.min_dist(i, 0), i)
+        self.assertLessEqual(a.dist_cache.stats()["bytes"], 100)
+        self.assertEqual(len(a.dist_cache), 2)
+        #A row growing past the budget with a new vertex is dropped, not kept short
+        a=Graph( list(range(10)) , [(i, i+1) for i in range(9)] , cache_bytes=40 )
+        self.assertEqual(a.min_dist(0, 9), 9)
+        self.assertEqual(len(a.dist_cache), 1)
+        a.add_vertex(10)
+        self.assertEqual(len(a.dist_cache), 0)
+        self.assertIsNone(a.min_dist(0, 10))
+        self.assertEqual(a.min_dist(9, 0), 9)
+
+    def test_shortest_paths(self):
+        side=30
+        vertices=list(range(side*side))
+        edges=[(i, i+1) for i in vertices if i%side!=side-1]+[(i, i+side) for i in vertices if i+side<side*side]
+        a=Graph( vertices , edges )
+        self.assertEqual(a.count_shortest_paths(0, side*side-1), math.comb(2*side-2, side-1))
+        first=list(itertools.islice(a.iter_shortest_paths(0, side*side-1), 3))
+        self.assertEqual(first[0], list(range(side))+[side-1+side*i for i in range(1, side)])
+        self.assertEqual(len(first), 3)
+        a=Graph( [1, 2, 3, 4, 5, 6] , [(1, 2), (1, 5), (2, 3), (2, 5), (3, 4), (4, 5), (4, 6), (3, 6)] )
+        self.assertEqual(list(a.iter_shortest_paths(1, 6)), [[1, 2, 3, 6], [1, 5, 4, 6]])
+        self.assertEqual(a.count_shortest_paths(1, 6), 2)
+        self.assertEqual(a.count_shortest_paths(1, 1), 1)
+        self.assertEqual(sorted(a.all_paths(1, 6, 4)), [[1, 2, 3, 4, 6], [1, 2, 5, 4, 6], [1, 5, 2, 3, 6], [1, 5, 4, 3, 6]])
+        self.assertIsNone(a.all_paths(1, 6, 2))
+
+    def test_parallel_betweenness_centrality(self):
+        edges=[(i, (7*i+3)%60) for i in range(60) if i!=(7*i+3)%60]+[(i, i+1) for i in range(59)]
+        edges=list(set((min(e), max(e)) for e in edges))
+        serial=Graph( list(range(60)) , edges ).all_betweenness_centrality()
+        parallel=Graph( list(range(60)) , edges ).all_betweenness_centrality(workers=2)
+        self.assertEqual(serial, parallel)
+        a=Graph( [0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11] , [(0, 4), (1, 2), (2, 6), (3, 6), (2, 4), (5, 10), (0, 6), (5, 7), (1, 8), (8, 9), (6, 10), (10, 11)] )
+        self.assertAlmostEqual(a.top_k_betweenness_centrality(workers=2)[1], 0.6545454545454545 ,delta=0.00001 )
+
+    def test_distance_matrix(self):
+        a=Graph( [1, 2, 3, 4, 5, 6, 7] , [(1, 2), (1, 5), (2, 3), (2, 5), (3, 4), (4, 5), (4, 6), (3, 6)] )
+        matrix=a.distance_matrix()
+        for i, u in enumerate(a.vertices):
+            for j, v in enumerate(a.vertices):
+                expected=a.min_dist(u, v)
+                self.assertEqual(matrix[i][j], -1 if expected is None else expected)
+        self.assertEqual(matrix[0].typecode, 'i')
+        rows=a.distances_from([6, 1, 6])
+        self.assertEqual(list(rows[1]), [0, 1, 2, 2, 1, 3, -1])
+        self.assertEqual(rows[0], rows[2])
+
+    def test_approximate_betweenness_centrality(self):
+        graphs=[
+            ( [0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13] , [(0, 5), (1, 2), (2, 7), (3, 13), (0, 4), (5, 9), (6, 8), (4, 7), (1, 8), (8, 9), (10, 13), (6, 11), (3, 12), (6, 13)] ),
+            ( [0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15, 16, 17, 18] , [(0, 2), (0, 1), (2, 6), (0, 3), (1, 4), (4, 5), (6, 10), (3, 7), (6, 8), (1, 9), (1, 10), (9, 11), (1, 12), (13, 15), (7, 14), (15, 18), (5, 16), (4, 17), (1, 18)] ),
+            ( [0, 1, 2, 3, 4, 5, 6] , [(0, 6), (1, 6), (2, 6), (0, 3), (4, 6), (1, 5), (3, 6)] ),
+        ]
+        for vertices, edges in graphs:
+            a=Graph( vertices , edges )
+            estimates, bound=a.approximate_betweenness_centrality(epsilon=0.1, delta=0.1, seed=7)
+            self.assertEqual([estimates, bound], a.approximate_betweenness_centrality(epsilon=0.1, delta=0.1, seed=7))
+            for exact, estimate in zip(a.all_betweenness_centrality(), estimates):
+                self.assertLessEqual(abs(exact-estimate), bound)
+            top=a.top_k_betweenness_centrality(approx=True, epsilon=0.1, seed=7)
+            self.assertEqual(top[0], a.top_k_betweenness_centrality()[0])
+            self.assertLessEqual(abs(top[1]-a.top_k_betweenness_centrality()[1]), bound)
+
+    def test_incremental_updates(self):
+        edges=[(i, i+1) for i in range(11)]+[(0, 6), (3, 9), (2, 4)]
+        a=Graph( list(range(12)) , list(edges) )
+        a.all_betweenness_centrality()
+        a.min_dist(0, 11)
+        a.min_dist(5, 11)
+        a.add_edge(9, 11)
+        a.remove_edge(3, 9)
+        a.add_vertex(12)
+        a.add_edge(12, 5)
+        a.remove_edge(0, 1)
+        #Cached betweenness is repaired, not dropped
+        self.assertIsNotNone(a._betweenness)
+        edges=edges+[(9, 11), (5, 12)]
+        edges.remove((3, 9))
+        edges.remove((0, 1))
+        b=Graph( list(range(13)) , edges )
+        for x, y in zip(a.all_betweenness_centrality(), b.all_betweenness_centrality()):
+            self.assertAlmostEqual(x, y ,delta=0.00001 )
+        for u in [0, 5, 11, 12]:
+            for v in b.vertices:
+                self.assertEqual(a.min_dist(u, v), b.min_dist(u, v))
+        self.assertEqual(sorted(a.edges), sorted(b.edges))
+        self.assertRaises(Exception, a.add_edge, 9, 11)
+        self.assertRaises(Exception, a.add_edge, 9, 13)
+        self.assertRaises(Exception, a.remove_edge, 3, 9)
+        self.assertRaises(Exception, a.add_vertex, 12)
+        #Joining two components, then cutting them apart again
+        vertices=list(range(6))
+        c=Graph(vertices, [(0, 1), (1, 2), (3, 4), (4, 5)])
+        c.all_betweenness_centrality()
+        with c.profile():
+            c.add_edge(2, 3)
+        self.assertIsNotNone(c._betweenness)
+        #The three nodes on the smaller side, plus the rows of 2 and 3
+        self.assertEqual(c.stats()["bfs"]["runs"], 5)
+        for x, y in zip(c.all_betweenness_centrality(), Graph(vertices, [(i, i+1) for i in range(5)]).all_betweenness_centrality()):
+            self.assertAlmostEqual(x, y, delta=1e-12)
+        c.remove_edge(3, 2)
+        self.assertEqual(list(c._betweenness), [0, 2, 0, 0, 2, 0])
+        c.add_vertex(6)
+        self.assertEqual(vertices, list(range(6)))
+
+    def test_validate(self):
+        self.assertRaises(Exception, Graph, [0, 1, 1] , [(0, 1)] )
+        self.assertRaises(Exception, Graph, [0, 1, 2] , [(0, 1), (1, 0)] )
+        self.assertRaises(Exception, Graph, [0, 1, 2] , [(0, 1), (1, 3)] )
+        a=Graph( ["a", "b", "c"] , [("a", "b"), ("c", "b")] )
+        self.assertEqual(a.edges, [("a", "b"), ("b", "c")])
+        #Endpoints are ordered as (min, max) whatever the order of vertices
+        self.assertEqual(Graph([3, 1, 2], [(1, 3), (2, 1)]).edges, [(1, 3), (1, 2)])
+        self.assertEqual(a.min_dist("a", "c"), 2)
+
+    def test_from_edgelist(self):
+        text="# comment\n1 2\n2 3\n\n3 4 0.5\n4 1\nx 1\n"
+        with tempfile.TemporaryDirectory() as directory:
+            path=os.path.join(directory, "edges.txt")
+            with open(path, "w") as f:
+                f.write(text)
+            for use_mmap in [False, True]:
+                a=Graph.from_edgelist(path, mmap=use_mmap, chunk_size=4)
+                self.assertEqual(a.vertices, [1, 2, 3, 4, "x"])
+                self.assertEqual(a.edges, [(1, 2), (1, 4), (1, "x"), (2, 3), (3, 4)])
+        a=Graph.from_edgelist(io.StringIO("a,b\nb,c\nc,d\n"), delimiter=",")
+        self.assertEqual(a.vertices, ["a", "b", "c", "d"])
+        self.assertEqual(a.min_dist("a", "d"), 3)
+        self.assertRaises(Exception, Graph.from_edgelist, io.StringIO("1 2\n2 1\n"))
+        self.assertRaises(Exception, Graph.from_edgelist, io.StringIO("1 2\n3\n"))
+        #Only plain integer literals become integers
+        a=Graph.from_edgelist(io.StringIO("1 01\n+1 1_0\n10 -3\n0 -0\n"))
+        self.assertEqual(a.vertices, [1, "01", "+1", "1_0", 10, -3, 0, "-0"])
+
+    def test_save_load(self):
+        a=Graph( ["a", "b", "c", "d", "e"] , [("a", "b"), ("b", "c"), ("c", "d"), ("b", "d"), ("d", "e")] )
+        scores=a.all_betweenness_centrality()
+        a.min_dist("a", "e")
+        with tempfile.TemporaryDirectory() as directory:
+            path=os.path.join(directory, "graph.nmg")
+            a.save(path)
+            for use_mmap in [True, False]:
+                b=Graph.load(path, mmap=use_mmap, verify=True)
+                self.assertEqual(b.vertices, a.vertices)
+                self.assertEqual(b.edges, a.edges)
+                self.assertEqual(b.all_betweenness_centrality(), scores)
+                self.assertIn(0, b.dist_cache)
+                self.assertEqual(b.min_dist("e", "a"), 3)
+                b.add_edge("a", "e")
+                self.assertEqual(b.min_dist("e", "a"), 1)
+            b=Graph.load(path)
+            self.assertEqual(b.dist_cache.stats()["misses"], 0)
+
+            with open(path, "r+b") as f:
+                data=f.read()
+                #Corrupt the last byte of the file, in the last saved section
+                f.seek(len(data)-1)
+                f.write(bytes([data[-1]^0xff]))
+            b=Graph.load(path)
+            self.assertEqual(b.all_betweenness_centrality(), scores)
+            #Distance rows are only checked when first used, and the damaged one is then computed again
+            self.assertEqual(len(b.dist_cache), 1)
+            self.assertEqual(b.min_dist("a", "e"), 3)
+            self.assertEqual(b.dist_cache.stats()["misses"], 1)
+            self.assertEqual(b.min_dist("a", "e"), 3)
+            self.assertEqual(b.dist_cache.stats()["hits"], 1)
+
+            with open(path, "r+b") as f:
+                f.write(b"XXXX")
+            self.assertRaises(Exception, Graph.load, path)
+
+    def test_profile(self):
+        a=Graph( ["a", "b", "c", "d", "e"] , [("a", "b"), ("b", "c"), ("c", "d"), ("b", "d"), ("d", "e")] )
+        self.assertIsNone(a.stats())
+        a.min_dist("a", "e")
+        with a.profile() as stats:
+            self.assertEqual(a.min_dist("a", "e"), 3)
+            self.assertEqual(a.min_dist("b", "e"), 2)
+            self.assertEqual(len(list(a.iter_shortest_paths("a", "e"))), 1)
+            a.all_betweenness_centrality()
+        result=a.stats()
+        self.assertEqual(result["methods"]["min_dist"]["calls"], 2)
+        self.assertEqual(result["methods"]["iter_shortest_paths"]["calls"], 1)
+        #Paths are walked back from the distance row of their end
+        self.assertEqual(result["cache"], {"hits": 1, "misses": 2, "evictions": 0})
+        #Rows of b and e, then five for betweenness, each expanding the whole graph
+        self.assertEqual(result["bfs"], {"runs": 7, "nodes_expanded": 35, "edges_expanded": 70})
+        self.assertEqual(result["paths_enumerated"], 1)
+        self.assertEqual(json.loads(stats.to_json()), result)
+        #Nothing is recorded outside the block, where methods are not wrapped
+        a.min_dist("a", "c")
+        self.assertEqual(a.stats(), result)
+        self.assertIs(a.min_dist.__func__, Graph.min_dist)
+        #Nested blocks record their own calls
+        with a.profile() as outer:
+            a.min_dist("a", "c")
+            with a.profile() as inner:
+                a.min_dist("a", "d")
+        self.assertEqual(outer.as_dict()["methods"]["min_dist"]["calls"], 1)
+        self.assertEqual(inner.as_dict()["methods"]["min_dist"]["calls"], 1)
+
+    def test_top_k_leaves(self):
+        #Hub 0 with leaves 5..9, path 0-1-2-3 with leaves 10, 11 on 3, and 4 hanging off 2
+        edges=[(0, v) for v in range(5, 10)]+[(0, 1), (1, 2), (2, 3), (2, 4), (3, 10), (3, 11)]
+        scores=Graph(list(range(12)), edges).all_betweenness_centrality()
+        ranked=sorted(range(12), key=lambda v: -scores[v])
+        for k in range(1, 5):
+            a=Graph(list(range(12)), edges)
+            with a.profile():
+                nodes, score=a.top_k_betweenness_centrality(k=k)
+            self.assertEqual(nodes, sorted(ranked[:k]))
+            self.assertTrue(math.isclose(score, scores[ranked[k-1]]))
+            #Leaves are run together with their neighbour, and the scores are kept
+            self.assertEqual(a.stats()["bfs"]["runs"], 4)
+            for x, y in zip(a.all_betweenness_centrality(), scores):
+                self.assertTrue(math.isclose(x, y, abs_tol=1e-12))
+        #Known scores give the same nodes, in the same order
+        a=Graph(list(range(12)), edges)
+        a.all_betweenness_centrality(workers=2)
+        self.assertEqual(a.top_k_betweenness_centrality(k=2), [[0, 2], scores[2]])
+        #Ties with the k-th node are included, and k beyond the number of nodes keeps them all
+        b=Graph( ["a", "b", "c", "d", "e"] , [("a", "b"), ("b", "c"), ("c", "d"), ("d", "e"), ("e", "a")] )
+        #Every node is inside the shortest path between its two neighbours
+        self.assertEqual(b.top_k_betweenness_centrality(k=2), [["a", "b", "c", "d", "e"], 2/12])
+        self.assertEqual(len(a.top_k_betweenness_centrality(k=20)[0]), 12)
+        #Both ends of an isolated edge are leaves
+        c=Graph(list(range(5)), [(0, 1), (1, 2), (3, 4)])
+        self.assertEqual(c.top_k_betweenness_centrality(k=1), [[1], 2/12])
+        with self.assertRaises(Exception):
+            a.top_k_betweenness_centrality(k=0)
+        #A graph without vertices has no top nodes
+        self.assertEqual(Graph([], []).top_k_betweenness_centrality(), [[], 0])
+        self.assertEqual(Graph([], []).top_k_betweenness_centrality(k=3), [[], 0])
+
+    def test_blocks(self):
+        #Triangle a-b-c with a tail c-d-e, a square f-g-h-i sharing h with a triangle h-j-k, and isolated l
+        edges=[("a", "b"), ("b", "c"), ("a", "c"), ("c", "d"), ("d", "e"), ("f", "g"), ("g", "h"), ("h", "i"), ("i", "f"), ("h", "j"), ("j", "k"), ("h", "k")]
+        vertices=["a", "b", "c", "d", "e", "f", "g", "h", "i", "j", "k", "l"]
+        a=Graph(vertices, edges)
+        self.assertEqual(a.connected_components(), [["a", "b", "c", "d", "e"], ["f", "g", "h", "i", "j", "k"], ["l"]])
+        self.assertEqual(sorted(a.biconnected_components()), [["a", "b", "c"], ["c", "d"], ["d", "e"], ["f", "g", "h", "i"], ["h", "j", "k"]])
+        self.assertEqual(a.articulation_points(), ["c", "d", "h"])
+        self.assertIsNone(a.min_dist("a", "f"))
+        scores=Graph(vertices, edges).all_betweenness_centrality()
+        with a.profile():
+            block_scores=a.all_betweenness_centrality(blocks=True)
+        for x, y in zip(scores, block_scores):
+            self.assertTrue(math.isclose(x, y, abs_tol=1e-12))
+        #c separates a and b from d and e, d separates e from a, b and c: 2*2*2 and 2*3 ordered pairs
+        self.assertTrue(math.isclose(block_scores[2], 8/110))
+        self.assertTrue(math.isclose(block_scores[3], 6/110))
+        self.assertEqual(block_scores[11], 0)
+        #Only the triangles and the square are searched
+        self.assertEqual(a.stats()["bfs"]["runs"], 10)
+        self.assertTrue(math.isclose(a.betweenness_centrality("h", blocks=True), scores[7]))
+
+    def test_centralities(self):
+        #Square a-b-c-d with a tail d-e, and isolated f
+        a=Graph( ["a", "b", "c", "d", "e", "f"] , [("a", "b"), ("b", "c"), ("c", "d"), ("d", "a"), ("d", "e")] )
+        result=a.centralities()
+        self.assertEqual(sorted(result), sorted(["betweenness", "edge_betweenness", "closeness", "harmonic", "stress", "eccentricity"]))
+        #Betweenness is summed like all_betweenness_centrality does, and kept
+        self.assertEqual(list(result["betweenness"]), Graph(a.vertices, a.edges).all_betweenness_centrality())
+        with a.profile():
+            self.assertEqual(a.centralities(["betweenness"]), {"betweenness": result["betweenness"]})
+        self.assertEqual(a.stats()["bfs"]["runs"], 0)
+        #d is on the paths a-c, a-e, c-e and both paths b-e, each counted from both ends
+        self.assertEqual(list(result["stress"]), [4, 2, 4, 10, 0, 0])
+        self.assertEqual(list(result["eccentricity"]), [2, 3, 2, 2, 3, 0])
+        self.assertTrue(math.isclose(result["harmonic"][3], 3.5))
+        self.assertTrue(math.isclose(result["closeness"][3], (4/5)*(4/5)))
+        self.assertEqual(result["closeness"][5], 0)
+        #The bridge d-e carries every ordered pair with e at one end
+        self.assertEqual(a.edges[3], ("c", "d"))
+        self.assertEqual(a.edges[4], ("d", "e"))
+        self.assertTrue(math.isclose(result["edge_betweenness"][4], 8/30))
+        self.assertEqual(list(a.centralities(["eccentricity"])), ["eccentricity"])
+        with self.assertRaises(Exception):
+            a.centralities(["pagerank"])
+
+    def test_query_server(self):
+        a=Graph( ["a", "b", "c", "d", "e"] , [("a", "b"), ("b", "c"), ("c", "d"), ("b", "d"), ("d", "e")] )
+        server=QueryServer(a)
+
+        async def ask(lines):
+            return(await asyncio.gather(*[server.handle(line) for line in lines]))
+
+        with a.profile():
+            answers=[json.loads(answer) for answer in asyncio.run(ask(['{"id": %d, "query": "top_k"}' % i for i in range(3)]+['{"query": "betweenness", "node": "d"}']))]
+        server.close()
+        self.assertEqual([answer["id"] for answer in answers], [0, 1, 2, None])
+        self.assertEqual(answers[0]["result"], [["d", "b"], 0.5])
+        self.assertEqual(answers[2]["result"], answers[0]["result"])
+        self.assertEqual(answers[3]["result"], 0.5)
+        #The three identical queries were computed once
+        self.assertEqual(a.stats()["methods"]["top_k_betweenness_centrality"]["calls"], 1)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path=os.path.join(tmp, "graph.txt")
+            with open(path, "w") as f:
+                f.write("a b\nb c\nc d\nb d\nd e\n")
+            queries='{"id": 1, "query": "min_dist", "start": "a", "end": "e"}\n'
+            queries+='{"id": 2, "query": "shortest_paths", "start": "a", "end": "c"}\n'
+            queries+='{"id": 3, "query": "min_dist", "start": "a", "end": "z"}\n'
+            queries+='{"id": 4, "query": "closeness"}\n'
+            #Top k answers are the same before and after the scores are known
+            queries+='{"id": 5, "query": "top_k", "k": 1}\n'
+            queries+='{"id": 6, "query": "betweenness"}\n'
+            queries+='{"id": 7, "query": "top_k", "k": 1}\n'
+            script=os.path.join(os.path.dirname(os.path.abspath(__file__)), "nodemetrics.py")
+            output=subprocess.run([sys.executable, script, "serve", "--graph", path, "--workers", "2"], input=queries, capture_output=True, text=True, check=True, timeout=60).stdout
+        answers={answer["id"]: answer for answer in map(json.loads, output.splitlines())}
+        self.assertEqual(answers[1]["result"], 3)
+        self.assertEqual(answers[2]["result"], [["a", "b", "c"]])
+        self.assertIn("error", answers[3])
+        self.assertIn("error", answers[4])
+        self.assertEqual(answers[5]["result"], [["b", "d"], 0.5])
+        self.assertEqual(answers[6]["result"], [["a", 0.0], ["b", 0.5], ["c", 0.0], ["d", 0.5], ["e", 0.0]])
+        self.assertEqual(answers[7]["result"], answers[5]["result"])
+
+    def test_benchmark_regressions(self):
+        from benchmarks.run import compare, run_suite, scaling_exponent
+        #Times of a known power law give back its exponent, while degenerate series have none
+        self.assertAlmostEqual(scaling_exponent([(n, 3e-6*n**2) for n in [100, 200, 400, 800]]), 2.0, delta=1e-9)
+        self.assertAlmostEqual(scaling_exponent([(100, 0.5), (1000, 0.05)]), -1.0, delta=1e-9)
+        self.assertIsNone(scaling_exponent([(100, 0.5)]))
+        self.assertIsNone(scaling_exponent([(100, 0.5), (100, 0.7), (200, 0.0)]))
+
+        def suite(seconds, exponent):
+            results=[{"family": "grid", "operation": "min_dist", "num_of_nodes": n, "seconds": s} for n, s in zip([100, 200], seconds)]
+            return({"results": results, "exponents": {"grid/min_dist": exponent}})
+
+        baseline=suite([0.10, 0.40], 2.0)
+        #Within tolerance, or slower by less than min_seconds
+        self.assertEqual(compare(suite([0.14, 0.59], 2.2), baseline), [])
+        self.assertEqual(compare(suite([0.003, 0.012], 2.0), suite([0.001, 0.004], 2.0)), [])
+        #Time regression
+        failures=compare(suite([0.10, 0.70], 2.0), baseline)
+        self.assertEqual(len(failures), 1)
+        self.assertIn("n=200", failures[0])
+        #Exponent regression, also caught with a tighter tolerance
+        failures=compare(suite([0.10, 0.40], 2.5), baseline)
+        self.assertEqual(len(failures), 1)
+        self.assertIn("grid/min_dist", failures[0])
+        self.assertEqual(len(compare(suite([0.14, 0.59], 2.2), baseline, tolerance=0.3, exponent_tolerance=0.1)), 3)
+        #Series missing from the baseline are not compared
+        self.assertEqual(compare(suite([5.0, 9.0], None), {"results": [], "exponents": {}}), [])
+        #Nor are exponents of series with a time below min_seconds
+        self.assertEqual(compare(suite([0.004, 0.40], 2.5), baseline), [])
+        #A suite passes against a baseline run by the same code, even when too fast to fit exponents
+        first=run_suite([20, 40], ["path", "grid"], ["init", "min_dist"], repeat=1)
+        self.assertEqual(set(first["exponents"].values()), {None})
+        self.assertEqual(compare(run_suite([20, 40], ["path", "grid"], ["init", "min_dist"], repeat=1), first), [])
+        self.assertEqual(compare(first, first), [])
+
 if __name__=='__main__':
     unittest.main()